@@ -0,0 +1,191 @@
+"""
+Whole-graph analytics on SciPy sparse matrices.
+Needs numpy and scipy: pip install causality_lang[analytics]
+"""
+
+from __future__ import annotations
+from functools import cached_property
+from typing import Iterable, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from causality_lang import Graph, Node
+from compiled import Compact_graph
+
+
+class Sparse_graph:
+    """
+    A graph as sparse adjacency matrices over one node numbering.
+    Index i is node i of the graph's Compact_graph: breadth first, top-level nodes
+    first, placeholders for undefined connection targets last. ids[i] is its
+    dotted path and nodes[i] the Node, when built from a Graph.
+    adjacency[conn_type][i, j] counts the conn_type connections from i to j,
+    hierarchy[i, j] is 1 when j is a child of i.
+    """
+
+    def __init__(self, compact: Compact_graph, nodes: list[Node] | None = None) -> None:
+        self.compact = compact
+        self.nodes = nodes
+        self.size = len(compact._aliases)
+        self.adjacency: dict[str, sparse.csr_matrix] = {
+            conn_type: self._csr(offsets, targets)
+            for conn_type, (offsets, targets) in compact._edges.items()
+        }
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> Sparse_graph:
+        return cls(*Compact_graph._from_graph(graph))
+
+    def _csr(self, offsets: Sequence[int], targets: Sequence[int]) -> sparse.csr_matrix:
+        # offsets only cover the tree, placeholders have no connections
+        tree = np.frombuffer(offsets, dtype=np.uint32)
+        indptr = np.full(self.size + 1, tree[-1], dtype=np.int64)
+        indptr[: len(tree)] = tree
+        indices = np.frombuffer(targets, dtype=np.uint32).astype(np.int64)
+        data = np.ones(len(indices))
+        matrix = sparse.csr_matrix((data, indices, indptr), (self.size, self.size))
+        matrix.sum_duplicates()
+        return matrix
+
+    @cached_property
+    def hierarchy(self) -> sparse.csr_matrix:
+        compact = self.compact
+        roots, tree = compact._root_count, compact._tree_size
+        first_child = np.frombuffer(compact._first_child, dtype=np.uint32)
+        indptr = np.full(self.size + 1, tree - roots, dtype=np.int64)
+        indptr[: tree + 1] = first_child.astype(np.int64) - roots
+        indices = np.arange(roots, tree)
+        data = np.ones(len(indices))
+        return sparse.csr_matrix((data, indices, indptr), (self.size, self.size))
+
+    @cached_property
+    def ids(self) -> list[str]:
+        return [self.compact.path_of(i) for i in range(self.size)]
+
+    @cached_property
+    def _positions(self) -> dict[int, int]:
+        if self.nodes is None:
+            raise TypeError("Built from a Compact_graph, use ids or paths")
+        return {id(node): i for i, node in enumerate(self.nodes)}
+
+    def index(self, node: Node | str | int) -> int:
+        """Index of a Node, a dotted path or alias, or an index"""
+        if isinstance(node, int):
+            return node
+        if isinstance(node, str):
+            return self.compact.find_node(node)
+        if (i := self._positions.get(id(node))) is None:
+            raise SyntaxError("Nonexistant node")
+        return i
+
+    def matrix(self, types: Iterable[str] | None = None) -> sparse.csr_matrix:
+        """The adjacency of the given connection types (all of them by default)"""
+        chosen = self.adjacency if types is None else types
+        total = sparse.csr_matrix((self.size, self.size))
+        for conn_type in chosen:
+            if conn_type in self.adjacency:
+                total = total + self.adjacency[conn_type]
+        return total
+
+    # Analytics, by index, see by_id and top to map back to ids
+    def out_degree(self, types: Iterable[str] | None = None) -> np.ndarray:
+        return np.asarray(self.matrix(types).sum(axis=1)).ravel()
+
+    def in_degree(self, types: Iterable[str] | None = None) -> np.ndarray:
+        return np.asarray(self.matrix(types).sum(axis=0)).ravel()
+
+    def degrees(self) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """(in-degree, out-degree) of every node, by connection type"""
+        return {
+            conn_type: (
+                np.asarray(matrix.sum(axis=0)).ravel(),
+                np.asarray(matrix.sum(axis=1)).ravel(),
+            )
+            for conn_type, matrix in self.adjacency.items()
+        }
+
+    def pagerank(
+        self,
+        types: Iterable[str] | None = None,
+        reverse: bool = False,
+        damping: float = 0.85,
+        tol: float = 1e-10,
+        max_iter: int = 100,
+    ) -> np.ndarray:
+        """
+        PageRank by power iteration, summing to 1. Nodes without connections spread
+        their rank over every node. reverse follows connections back to their origins.
+        """
+        if self.size == 0:
+            return np.zeros(0)
+        matrix = self.matrix(types)
+        if reverse:
+            matrix = matrix.T.tocsr()
+        out = np.asarray(matrix.sum(axis=1)).ravel()
+        dangling = out == 0
+        scale = np.divide(1.0, out, out=np.zeros(self.size), where=~dangling)
+        # column-stochastic: transition[j, i] is the chance to go from i to j
+        transition = (sparse.diags(scale) @ matrix).T.tocsr()
+        rank = np.full(self.size, 1.0 / self.size)
+        for _ in range(max_iter):
+            spread = (damping * rank[dangling].sum() + 1.0 - damping) / self.size
+            new = damping * (transition @ rank) + spread
+            done = np.abs(new - rank).sum() < tol
+            rank = new
+            if done:
+                break
+        return rank
+
+    def influential_causes(
+        self, k: int = 10, types: Iterable[str] | None = None
+    ) -> list[tuple[str, float]]:
+        """The k nodes the most connections lead back to, by reversed PageRank"""
+        return self.top(self.pagerank(types, reverse=True), k)
+
+    def k_hop(
+        self,
+        sources: Iterable[Node | str | int],
+        k: int,
+        types: Iterable[str] | None = None,
+        reverse: bool = False,
+    ) -> list[np.ndarray]:
+        """
+        For every source, the sorted indices of the nodes at most k connections away
+        (the source itself left out). All sources step together, one sparse product
+        per hop. reverse follows connections back to their origins.
+        """
+        sources = [self.index(source) for source in sources]
+        count = len(sources)
+        matrix = self.matrix(types)
+        step = matrix if reverse else matrix.T.tocsr()
+        start = sparse.csr_matrix(
+            (np.ones(count), (sources, np.arange(count))), (self.size, count)
+        )
+        reached = frontier = start
+        for _ in range(k):
+            frontier = (step @ frontier).astype(bool).astype(np.float64)
+            frontier = (frontier - frontier.multiply(reached)).tocsr()
+            frontier.eliminate_zeros()
+            if not frontier.nnz:
+                break
+            reached = reached + frontier
+        found = (reached - start).tocsc()
+        found.eliminate_zeros()
+        found.sort_indices()
+        return [
+            found.indices[found.indptr[i] : found.indptr[i + 1]].copy()
+            for i in range(count)
+        ]
+
+    # Mapping back to ids
+    def by_id(self, values: np.ndarray) -> dict[str, float]:
+        return {id: float(value) for id, value in zip(self.ids, values)}
+
+    def top(self, values: np.ndarray, k: int = 10) -> list[tuple[str, float]]:
+        """The k highest values with their ids, highest first"""
+        order = np.argsort(-values, kind="stable")[:k]
+        return [(self.ids[i], float(values[i])) for i in order]
+
+    def labels(self, indices: Iterable[int]) -> list[str]:
+        return [self.ids[i] for i in indices]
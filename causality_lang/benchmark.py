@@ -0,0 +1,335 @@
+"""
+Benchmarks for the nodelang parser and graph.
+Run with: python benchmark.py [sizes...] [--output results.json] [--compare old.json]
+python benchmark.py --help lists the document options.
+"""
+
+from __future__ import annotations
+from collections import deque
+from typing import Any, Callable
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from causality_lang import Graph
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "extensions", "flashcards")
+)
+import flashcards  # noqa: E402
+
+CONNECTION_TYPES = ["caused", "contributed", "influenced", "contemporary"]
+_WORDS = (
+    "the of reform church state trade war crown people law power land tax "
+    "movement empire rise fall city faith money army revolt idea print"
+).split()
+
+
+def generate_document(
+    node_count: int = 1000,
+    depth: int = 2,
+    fan_out: int = 3,
+    connection_density: float = 1.0,
+    comment_ratio: float = 0.1,
+    seed: int = 0,
+) -> str:
+    """
+    A random but reproducible nodelang document with node_count nodes.
+    Every top-level definition is elaborated breadth first, up to depth levels of
+    1 to fan_out children a node. connection_density is the average number of
+    connection targets a node, comment_ratio the share of annotation lines.
+    """
+    rng = random.Random(seed)
+    lines: list[str] = []
+
+    def text() -> str:
+        return " ".join(rng.choices(_WORDS, k=rng.randint(2, 8)))
+
+    def emit(line: str):
+        while rng.random() < comment_ratio:
+            lines.append(f"# {text()}")
+        lines.append(line)
+
+    paths: list[str] = []
+    made = top = 0
+    while made < node_count:
+        alias = f"t{top}"
+        emit(f"{text()} {top} ({alias}) : {text()}")
+        subtree = [alias]
+        made += 1
+        top += 1
+        queue = deque([(alias, 0)])
+        while queue and made < node_count:
+            path, level = queue.popleft()
+            if level == depth:
+                continue
+            for i in range(rng.randint(1, fan_out)):
+                if made == node_count:
+                    break
+                emit(f"{path} < (c{i}) {text()}")
+                subtree.append(f"{path}.c{i}")
+                queue.append((f"{path}.c{i}", level + 1))
+                made += 1
+        paths += subtree
+
+        # connections from the new nodes, to any node defined so far
+        targets = round(len(subtree) * connection_density)
+        while targets > 0:
+            count = min(targets, rng.randint(1, 3))
+            ends = " & ".join(rng.choice(paths) for _ in range(count))
+            emit(f"{rng.choice(subtree)} <{rng.choice(CONNECTION_TYPES)}> {ends}")
+            targets -= count
+    return "\n".join(lines)
+
+
+def synthetic_document(node_count: int) -> str:
+    """node_count nodes, half of them top-level vocab, half elaborations"""
+    lines = []
+    for i in range(node_count // 2):
+        lines.append(f"vocab number {i} (v{i}) : some content about {i}")
+        lines.append(f"v{i} < (c{i}) child content {i}")
+        lines.append(f"v{i} <caused> v{max(i - 1, 0)} & thing{i % 1000}")
+    return "\n".join(lines)
+
+
+def _best(run: Callable[[], Any], repeat: int) -> tuple[float, float]:
+    """Fastest of repeat runs in seconds, and how much slower the slowest was"""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    fastest = min(times)
+    return fastest, (max(times) - fastest) / fastest if fastest else 0.0
+
+
+def _peak(run: Callable[[], Any]) -> int:
+    """Peak memory allocated while running, in bytes"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _parsed(code: str) -> Graph:
+    graph = Graph()
+    graph.parse(code)
+    return graph
+
+
+def _questions(graph: Graph) -> int:
+    return len(flashcards.FlashcardDeck(graph))
+
+
+def bench_size(
+    node_count: int, repeat: int = 3, lookups: int = 10_000, **document: Any
+) -> dict[str, Any]:
+    """Time and measure every benchmark on one generated document"""
+    code = generate_document(node_count, **document)
+    graph = _parsed(code)
+    rng = random.Random(document.get("seed", 0))
+    nodes: list[tuple[str, str]] = []  # (alias, dotted path)
+    managers = deque([graph.nodes])
+    while managers:
+        manager = managers.popleft()
+        for node in manager.get_all():
+            nodes.append((node.id, manager.path_of(node.id)))
+            managers.append(node.children)
+    # half dotted paths, half bare aliases
+    ids = [node[i % 2] for i, node in enumerate(rng.choices(nodes, k=lookups))]
+
+    parse, parse_spread = _best(lambda: _parsed(code), repeat)
+    find, find_spread = _best(lambda: [graph.nodes.find_node(id) for id in ids], repeat)
+    dump, dump_spread = _best(graph.dump, repeat)
+    cards, cards_spread = _best(lambda: _questions(graph), repeat)
+    line_count = code.count("\n") + 1
+    return {
+        "nodes": len(nodes),
+        "lines": line_count,
+        "bytes": len(code.encode()),
+        "parse_seconds": parse,
+        "parse_lines_per_second": line_count / parse,
+        "parse_nodes_per_second": len(nodes) / parse,
+        "parse_peak_bytes": _peak(lambda: _parsed(code)),
+        "find_node_seconds": find,
+        "find_node_per_second": lookups / find,
+        "dump_seconds": dump,
+        "flashcards_seconds": cards,
+        "flashcards": _questions(graph),
+        "flashcards_per_second": _questions(graph) / cards,
+        "flashcards_peak_bytes": _peak(lambda: _questions(graph)),
+        # how much slower than the fastest the slowest repeat was, see compare
+        "spread": {
+            "parse_seconds": parse_spread,
+            "find_node_seconds": find_spread,
+            "dump_seconds": dump_spread,
+            "flashcards_seconds": cards_spread,
+        },
+    }
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes: list[int], repeat: int = 3, **document: Any) -> dict[str, Any]:
+    """bench_size for every size, with what is needed to compare runs"""
+    return {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "document": document,
+        "repeat": repeat,
+        "results": [bench_size(size, repeat, **document) for size in sizes],
+    }
+
+
+def compare(old: dict[str, Any], new: dict[str, Any], threshold: float = 1.25) -> bool:
+    """
+    Print how long every benchmark of new takes against old, for the sizes both
+    ran. False when something got slower than threshold times old, or for times,
+    slower than the repeats of either run spread apart if that is more.
+    """
+    ok = True
+    before = {result["nodes"]: result for result in old["results"]}
+    for result in new["results"]:
+        if (previous := before.get(result["nodes"])) is None:
+            continue
+        for key in result:
+            if not key.endswith(("_seconds", "_bytes")) or key not in previous:
+                continue
+            ratio = result[key] / previous[key] if previous[key] else 1.0
+            noise = max(
+                result.get("spread", {}).get(key, 0.0),
+                previous.get("spread", {}).get(key, 0.0),
+            )
+            slower = ratio > max(threshold, 1 + 2 * noise)
+            ok &= not slower
+            flag = "  <- regression" if slower else ""
+            print(f"{result['nodes']:>9} {key:<24} {ratio:6.2f}x{flag}")
+    return ok
+
+
+def report(results: dict[str, Any]):
+    print(f"commit {results['commit']}, python {results['python']}")
+    for result in results["results"]:
+        print(f"{result['nodes']} nodes, {result['lines']} lines")
+        print(
+            f"  parse       {result['parse_seconds'] * 1000:10.1f} ms"
+            f"  {result['parse_lines_per_second']:12.0f} lines/s"
+            f"  peak {result['parse_peak_bytes'] / 2**20:8.1f} MiB"
+        )
+        print(
+            f"  find_node   {result['find_node_seconds'] * 1000:10.1f} ms"
+            f"  {result['find_node_per_second']:12.0f} lookups/s"
+        )
+        print(f"  dump        {result['dump_seconds'] * 1000:10.3f} ms")
+        print(
+            f"  flashcards  {result['flashcards_seconds'] * 1000:10.1f} ms"
+            f"  {result['flashcards_per_second']:12.0f} cards/s"
+            f"  peak {result['flashcards_peak_bytes'] / 2**20:8.1f} MiB"
+        )
+
+
+def compact_memory(node_count: int = 1_000_000) -> dict[str, float]:
+    """Memory held by a parsed Graph against its Compact_graph, in bytes"""
+    code = synthetic_document(node_count)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        graph = Graph()
+        graph.parse(code)
+        graph_bytes = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        compact = graph.compact()
+        build_time = time.perf_counter() - start
+        gc.collect()
+        compact_bytes = tracemalloc.get_traced_memory()[0] - graph_bytes
+    finally:
+        tracemalloc.stop()
+    return {
+        "nodes": len(compact),
+        "graph_bytes": graph_bytes,
+        "compact_bytes": compact_bytes,
+        "compact_nbytes": compact.nbytes,
+        "ratio": graph_bytes / compact_bytes,
+        "build_seconds": build_time,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sizes", nargs="*", type=int, default=[1_000, 10_000, 100_000])
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--fan-out", type=int, default=3)
+    parser.add_argument("--connection-density", type=float, default=1.0)
+    parser.add_argument("--comment-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="how many times slower than --compare counts as a regression",
+    )
+    parser.add_argument(
+        "--compact", action="store_true", help="Graph against Compact_graph memory"
+    )
+    args = parser.parse_args(argv)
+
+    if args.compact:
+        for size in args.sizes:
+            result = compact_memory(size)
+            print(f"{result['nodes']} nodes")
+            print(f"  Graph:         {result['graph_bytes'] / 2**20:8.1f} MiB")
+            print(f"  Compact_graph: {result['compact_bytes'] / 2**20:8.1f} MiB")
+            print(
+                f"  {result['ratio']:.1f}x smaller,"
+                f" built in {result['build_seconds']:.2f}s"
+            )
+        return 0
+
+    results = run(
+        args.sizes,
+        args.repeat,
+        depth=args.depth,
+        fan_out=args.fan_out,
+        connection_density=args.connection_density,
+        comment_ratio=args.comment_ratio,
+        seed=args.seed,
+    )
+    report(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            return 0 if compare(json.load(file), results, args.threshold) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
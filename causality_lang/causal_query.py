@@ -0,0 +1,209 @@
+"""
+Reverse edges, reachability and causal chains over the connections of a Graph,
+see Graph.query.
+"""
+
+from __future__ import annotations
+from collections import deque
+from typing import Iterable, Iterator
+
+from causality_lang import Change_log, Graph, Node
+
+
+Chain_step = tuple[Node, str, Node]  # origin, connection type, target
+
+
+class Causal_query:
+    """
+    Questions about the connections of a graph: what points at a node, what it
+    leads to, and through which chains. types narrows the connection types that
+    are followed, nodes can be given by name.
+    The reverse index is built the first time it is needed, it and the memoized
+    closures are dropped whenever the graph or any node of it changes.
+    """
+
+    closure_cache_size = 1024
+
+    def __init__(self, graph: Graph) -> None:
+        self.graph = graph
+        self._version = graph._version
+        # nodes and connections changed directly, which doesn't bump _version
+        self._log = Change_log()
+        # connection type -> id(target) -> origins, one per connection
+        self._reverse: dict[str, dict[int, list[Node]]] | None = None
+        # (id(node), types, reverse) -> reachable nodes by id, oldest use first
+        self._closures: dict[
+            tuple[int, frozenset[str] | None, bool], dict[int, Node]
+        ] = {}
+
+    def _fresh(self):
+        if self._version != self.graph._version or self._log._changed:
+            self._reverse = None
+            self._closures = {}
+            self._version = self.graph._version
+            self._log.take()
+
+    def _reverse_index(self) -> dict[str, dict[int, list[Node]]]:
+        if self._reverse is not None:
+            return self._reverse
+        reverse: dict[str, dict[int, list[Node]]] = {}
+        for node in self.graph.nodes.descendants():
+            for conn_type, dests in node.connections._conns.items():
+                by_target = reverse.setdefault(conn_type, {})
+                for dest in dests:
+                    if (origins := by_target.get(id(dest))) is None:
+                        by_target[id(dest)] = [node]
+                    else:
+                        origins.append(node)
+        self._reverse = reverse
+        return reverse
+
+    def _node(self, node: Node | str) -> Node:
+        return self.graph.nodes.find_node(node) if isinstance(node, str) else node
+
+    def _steps(
+        self, node: Node, types: frozenset[str] | None, reverse: bool
+    ) -> Iterator[tuple[str, Node]]:
+        """(connection type, neighbour) for the connections of node"""
+        if reverse:
+            for conn_type, by_target in self._reverse_index().items():
+                if types is None or conn_type in types:
+                    for origin in by_target.get(id(node), ()):
+                        yield conn_type, origin
+            return
+        for conn_type, dests in node.connections._conns.items():
+            if types is None or conn_type in types:
+                for dest in dests:
+                    yield conn_type, dest
+
+    def outgoing(
+        self, node: Node | str, types: Iterable[str] | None = None
+    ) -> list[Node]:
+        """What node connects to"""
+        self._fresh()
+        steps = self._steps(self._node(node), _types(types), False)
+        return list({id(dest): dest for _, dest in steps}.values())
+
+    def incoming(
+        self, node: Node | str, types: Iterable[str] | None = None
+    ) -> list[Node]:
+        """What connects to node, "what caused x" with types=["caused"]"""
+        self._fresh()
+        steps = self._steps(self._node(node), _types(types), True)
+        return list({id(origin): origin for _, origin in steps}.values())
+
+    def reachable(
+        self,
+        node: Node | str,
+        types: Iterable[str] | None = None,
+        reverse: bool = False,
+    ) -> list[Node]:
+        """
+        Every node a chain of connections leads to from node (to node if reverse),
+        nearest first, not counting node unless it is on a cycle
+        """
+        return list(self._closure(self._node(node), _types(types), reverse).values())
+
+    def reaches(
+        self, origin: Node | str, target: Node | str, types: Iterable[str] | None = None
+    ) -> bool:
+        """Whether a chain of connections leads from origin to target"""
+        closure = self._closure(self._node(origin), _types(types), False)
+        return id(self._node(target)) in closure
+
+    def _closure(
+        self, node: Node, types: frozenset[str] | None, reverse: bool
+    ) -> dict[int, Node]:
+        self._fresh()
+        key = (id(node), types, reverse)
+        if (closure := self._closures.pop(key, None)) is None:
+            closure = {}
+            frontier = deque([node])
+            while frontier:
+                for _, nxt in self._steps(frontier.popleft(), types, reverse):
+                    if id(nxt) not in closure:
+                        closure[id(nxt)] = nxt
+                        frontier.append(nxt)
+            if len(self._closures) >= self.closure_cache_size:
+                del self._closures[next(iter(self._closures))]
+        self._closures[key] = closure  # most recently used goes last
+        return closure
+
+    def shortest_chain(
+        self, origin: Node | str, target: Node | str, types: Iterable[str] | None = None
+    ) -> list[Chain_step] | None:
+        """
+        The fewest connections leading from origin to target, None if none do.
+        Searches from both ends at once, a level of the smaller side at a time.
+        """
+        self._fresh()
+        origin, target = self._node(origin), self._node(target)
+        wanted = _types(types)
+        if origin is target:
+            return []
+        # id(node) -> (step towards it from origin / from it towards target, depth)
+        ahead: dict[int, tuple[Chain_step | None, int]] = {id(origin): (None, 0)}
+        behind: dict[int, tuple[Chain_step | None, int]] = {id(target): (None, 0)}
+        ahead_level, behind_level = deque([origin]), deque([target])
+        while ahead_level and behind_level:
+            forward = len(ahead_level) <= len(behind_level)
+            level = ahead_level if forward else behind_level
+            seen, other = (ahead, behind) if forward else (behind, ahead)
+            depth = seen[id(level[0])][1] + 1
+            meet: Node | None = None
+            for _ in range(len(level)):
+                node = level.popleft()
+                for conn_type, nxt in self._steps(node, wanted, not forward):
+                    if id(nxt) in seen:
+                        continue
+                    step = (node, conn_type, nxt) if forward else (nxt, conn_type, node)
+                    seen[id(nxt)] = (step, depth)
+                    level.append(nxt)
+                    # the closest meeting point of this level makes the shortest chain
+                    if id(nxt) in other and (
+                        meet is None or other[id(nxt)][1] < other[id(meet)][1]
+                    ):
+                        meet = nxt
+            if meet is not None:
+                chain: list[Chain_step] = []
+                node = meet
+                while (step := ahead[id(node)][0]) is not None:
+                    chain.append(step)
+                    node = step[0]
+                chain.reverse()
+                node = meet
+                while (step := behind[id(node)][0]) is not None:
+                    chain.append(step)
+                    node = step[2]
+                return chain
+        return None
+
+    def all_chains(
+        self,
+        origin: Node | str,
+        target: Node | str,
+        types: Iterable[str] | None = None,
+        max_length: int | None = None,
+    ) -> Iterator[list[Chain_step]]:
+        """Chains from origin to target that visit no node twice, shortest first"""
+        self._fresh()
+        origin, target = self._node(origin), self._node(target)
+        wanted = _types(types)
+        frontier: deque[tuple[list[Chain_step], frozenset[int]]] = deque(
+            [([], frozenset([id(origin)]))]
+        )
+        while frontier:
+            chain, seen = frontier.popleft()
+            if max_length is not None and len(chain) >= max_length:
+                continue
+            node = chain[-1][2] if chain else origin
+            for conn_type, nxt in self._steps(node, wanted, False):
+                step = (node, conn_type, nxt)
+                if nxt is target:
+                    yield [*chain, step]
+                elif id(nxt) not in seen:
+                    frontier.append(([*chain, step], seen | {id(nxt)}))
+
+
+def _types(types: Iterable[str] | None) -> frozenset[str] | None:
+    return None if types is None else frozenset(types)
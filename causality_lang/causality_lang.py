@@ -1,9 +1,39 @@
 from __future__ import annotations
-from copy import deepcopy
-from dataclasses import dataclass, field
-from functools import wraps
-from typing import Any, Callable, Sequence, cast
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from enum import Enum, auto
+from functools import partial, wraps
+from operator import itemgetter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Sequence,
+    cast,
+)
+import gc
+import hashlib
+import importlib
+import io
+import json
+import mmap
+import os
+import re
+import subprocess
 import sys
+import tempfile
+import time
+import weakref
+
+if TYPE_CHECKING:
+    from causal_query import Causal_query
+    from compiled import Compact_graph
+    from parse_cache import Parse_cache
 
 
 FANCY_DEBUG_INFO: bool = True
@@ -105,60 +135,1045 @@ def handle_notelang_exception(func: Callable):
     return wrapper
 
 
-class Node_manager:
+@dataclass(frozen=True, slots=True)
+class Source_span:
+    """Where a piece of nodelang came from, as offsets into the buffer it was read in"""
+
+    source: str
+    start: int
+    end: int
+    line: int  # 1-based, counting every physical line
+    column: int  # 1-based
+    file: str | None = None
+
+    @property
+    def text(self) -> str:
+        return self.source[self.start : self.end]
+
+
+class Token_kind(Enum):
+    DEFINE = auto()  # vocab (alias) : content
+    ELABORATE = auto()  # parent < (sub-alias) content
+    CONTINUE = auto()  # < (sub-alias) content, << ... under the < line above
+    CONNECT = auto()  # node a <connection type> node b & node c
+    ANNOTATION = auto()  # # comment
+    INVALID = auto()  # anything else, reported when parsed
+
+
+class Token(NamedTuple):
+    """
+    One non-blank line of nodelang.
+    start/end are offsets of the stripped line in the scanned buffer.
+    fields depend on kind:
+    DEFINE (alias, name, content), ELABORATE (parent, alias, content),
+    CONTINUE (depth, alias, content), depth being the number of <,
+    CONNECT (origin, connection type, *targets), ANNOTATION and INVALID ()
+    """
+
+    kind: Token_kind
+    start: int
+    end: int
+    line: int
+    fields: tuple[str, ...] = ()
+
+    def span(self, source: str, file: str | None = None) -> Source_span:
+        column = self.start - source.rfind("\n", 0, self.start)
+        return Source_span(source, self.start, self.end, self.line, column, file)
+
+
+def _format_context(
+    span: Source_span, context_size: int = 3, color: bool = True
+) -> str:
+    """The lines around span, the line of span underlined"""
+
+    def mark(text: str, underline: bool) -> str:
+        return format_str(text, underline=underline) if color else text
+
+    if "\n" not in span.source.rstrip("\r\n"):
+        # streamed lines are parsed on their own, there is nothing around them
+        return mark(f"\n|{span.line}| {span.text}", True)
+    # physical lines, numbered like span.line even if source starts part way in
+    idx = span.source.count("\n", 0, span.start)
+    lines = [line.strip() for line in span.source.split("\n")]
+    if not lines[-1]:
+        lines.pop()  # source ended with a line break
+    first = span.line - idx
+    return "".join(
+        [
+            # |line#| line
+            mark(f"\n|{first + j}| {lines[j]}", idx == j)
+            # j - context size -> j + context size
+            for j in range(idx - context_size, idx + context_size + 1)
+            # if j in range
+            if j >= 0 and j < len(lines)
+        ]
+    )
+
+
+class Severity(Enum):
+    ERROR = "error"
+    WARNING = "warning"
+
+
+@dataclass(frozen=True, slots=True)
+class Diagnostic:
+    """A line a recovering parse skipped and why, only formatted when shown"""
+
+    severity: Severity
+    message: str
+    span: Source_span
+
+    def format(self, color: bool = True, context_size: int = 3) -> str:
+        span = self.span
+        where = f"{span.file or '<input>'}:{span.line}:{span.column}"
+        text = f"{where}: {self.severity.value}: {self.message}"
+        if color:
+            shade = LIGHTRED if self.severity is Severity.ERROR else YELLOW
+            text = format_str(text, shade, bold=True)
+        if context_size:
+            text += _format_context(span, context_size, color)
+        return text
+
+    def __str__(self) -> str:
+        return self.format(color=False, context_size=0)
+
+
+class _Diagnostics:
+    """What a recovering parse found, until max_errors errors"""
+
+    def __init__(self, max_errors: int | None = None) -> None:
+        self.found: list[Diagnostic] = []
+        self.max_errors = max_errors
+        self.errors = 0
+
+    @property
+    def full(self) -> bool:
+        return self.max_errors is not None and self.errors >= self.max_errors
+
+    def report(
+        self,
+        severity: Severity,
+        message: str,
+        token: Token,
+        source: str,
+        file: str | None,
+    ):
+        if self.full:
+            return
+        self.found.append(Diagnostic(severity, message, token.span(source, file)))
+        self.errors += severity is Severity.ERROR
+
+
+# a whole line, group 1 is the line without surrounding whitespace (None when blank)
+_LINE = re.compile(r"^[^\S\n]*(\S(?:[^\n]*\S)?)?[^\S\n]*$", re.MULTILINE)
+
+
+def _stream_tokens(lines: Iterable[str]) -> Iterator[tuple[Token, str]]:
+    """(token, line) for every non-blank line"""
+    for line_no, line in enumerate(lines, 1):
+        start, end = _LINE.match(line).span(1)
+        if start != -1:
+            yield _lex_line(line, start, end, line_no), line
+
+
+def _lex_line(code: str, start: int, end: int, line: int) -> Token:
+    """Classify code[start:end] (already stripped) without copying the line"""
+    if code.startswith("#", start, end):
+        return Token(Token_kind.ANNOTATION, start, end, line)
+
+    # continuation, before definitions as its content may have a colon in it
+    if code.startswith("<", start, end) and code.find(">", start, end) == -1:
+        depth = start
+        while depth < end and code[depth] == "<":
+            depth += 1
+        alias, content = _sub_alias(code[depth:end].strip())
+        depth -= start
+        if not alias:
+            return Token(Token_kind.INVALID, start, end, line)
+        return Token(Token_kind.CONTINUE, start, end, line, (depth, alias, content))
+
+    # definition
+    if (colon := code.find(":", start, end)) != -1:
+        name = code[start:colon].strip()
+        alias = ""
+        # check for alias
+        if name.endswith(")") and (paren := name.rfind("(")) != -1:
+            alias = name[paren + 1 : -1].strip()
+            name = name[:paren].strip()
+        alias = alias or name
+        if not alias:
+            return Token(Token_kind.INVALID, start, end, line)
+        content = code[colon + 1 : end].strip()
+        return Token(Token_kind.DEFINE, start, end, line, (alias, name, content))
+
+    lt = code.find("<", start, end)
+    if lt == -1:
+        return Token(Token_kind.INVALID, start, end, line)
+    left = code[start:lt].strip()
+
+    # if there is no > after the <, then it's an elaboration
+    if (gt := code.find(">", lt, end)) == -1:
+        alias, content = _sub_alias(code[lt + 1 : end].strip())
+        if not left or not alias:
+            return Token(Token_kind.INVALID, start, end, line)
+        return Token(Token_kind.ELABORATE, start, end, line, (left, alias, content))
+
+    # logical connection
+    connection = code[lt + 1 : gt].strip()
+    targets = [txt for txt in map(str.strip, code[gt + 1 : end].split("&")) if txt]
+    if not left or not connection or not targets:
+        return Token(Token_kind.INVALID, start, end, line)
+    return Token(Token_kind.CONNECT, start, end, line, (left, connection, *targets))
+
+
+def _sub_alias(right: str) -> tuple[str, str]:
+    """alias and content of "(sub-alias) content", the alias defaulting to content"""
+    if right.startswith("(") and (close := right.find(")")) != -1:
+        content = right[close + 1 :].strip()
+        return right[1:close].strip() or content, content
+    return right, right
+
+
+def tokenize(code: str, first_line: int = 1) -> Iterator[Token]:
+    """Scan code once, yielding a token for every non-blank line"""
+    for line, match in enumerate(_LINE.finditer(code), first_line):
+        start, end = match.span(1)
+        if start != -1:
+            yield _lex_line(code, start, end, line)
+
+
+class Alias_index:
+    """
+    Every node of a tree by dotted path (protref.prots) and by bare alias (prots),
+    kept up to date by the Node_managers it is attached to.
+    A name resolves to the node at that dotted path (top-level ids are paths too),
+    otherwise to the shallowest nested node with that alias, ties going to the
+    alphabetically first path.
+    """
+
     def __init__(self) -> None:
+        # sorted by _rank, the first entry is what a name resolves to
+        self._paths: dict[str, list[tuple[int, str, Node]]] = {}
+        self._aliases: dict[str, list[tuple[int, str, Node]]] = {}
+        # casefolded node name -> the nodes with that name
+        self._names: dict[str, list[Node]] = {}
+        self._ids = _Prefix_keys(self._has_id, lambda: {*self._paths, *self._aliases})
+        self._name_keys = _Prefix_keys(self._names.__contains__, self._names.keys)
+
+    def attach(self, manager: Node_manager, path: str = "", depth: int = 0):
+        """Index manager and everything under it, path being the path of its owner"""
+        manager._index = self
+        manager._path = path
+        manager._depth = depth
+        for node in manager._nodes.values():
+            self.add(node, manager)
+
+    def add(self, node: Node, manager: Node_manager):
+        depth = manager._depth
+        path = f"{manager._path}.{node.id}" if depth else node.id
+        entry = (depth, path, node)
+        if (entries := self._paths.get(path)) is None:
+            self._paths[path] = [entry]
+            self._ids.add(path)
+        else:
+            insort(entries, entry, key=_rank)
+        if depth:
+            if (entries := self._aliases.get(node.id)) is None:
+                self._aliases[node.id] = [entry]
+                self._ids.add(node.id)
+            else:
+                insort(entries, entry, key=_rank)
+        self._add_name(node, node.name)
+        if node.children._nodes:
+            self.attach(node.children, path, depth + 1)
+        else:
+            # a new node, saves walking its (empty) children
+            node.children._index = self
+            node.children._path = path
+            node.children._depth = depth + 1
+
+    def discard(self, node: Node, manager: Node_manager):
+        """Stop indexing node and everything under it"""
+        path = manager.path_of(node.id)
+        _discard_entry(self._paths, path, node)
+        if manager._depth:
+            _discard_entry(self._aliases, node.id, node)
+        if not self._has_id(path):
+            self._ids.discard()
+        if manager._depth and not self._has_id(node.id):
+            self._ids.discard()
+        self._discard_name(node, node.name)
+        for child in node.children._nodes.values():
+            self.discard(child, node.children)
+        node.children._index = None
+
+    def find(
+        self, name: str, accept: Callable[[Node], bool] | None = None
+    ) -> Node | None:
+        """What name resolves to, only counting the nodes accept returns True for"""
+        if accept is None:
+            if entries := self._paths.get(name):
+                return entries[0][2]
+            if entries := self._aliases.get(name):
+                return entries[0][2]
+            return None
+        for entry in (*self._paths.get(name, ()), *self._aliases.get(name, ())):
+            if accept(entry[2]):
+                return entry[2]
+        return None
+
+    def complete(
+        self, prefix: str, k: int = 10, fuzzy: bool = False, names: bool = False
+    ) -> list[tuple[str, Node]]:
+        """
+        Up to k (dotted path or alias, the node it resolves to) starting with
+        prefix, alphabetically. fuzzy also completes prefix with a typo in it
+        (portref, protef), after what prefix completes to as it is.
+        names completes node names instead, ignoring case.
+        """
+        if not names:
+            keys = self._ids.search(prefix, k, fuzzy)
+            return [(key, self._resolve(key)) for key in keys]
+        found: list[tuple[str, Node]] = []
+        for key in self._name_keys.search(prefix.casefold(), k, fuzzy):
+            found.extend((node.name, node) for node in self._names[key])
+            if len(found) >= k:
+                break
+        return found[:k]
+
+    def rename(self, node: Node, name: str):
+        """node is about to be called name, see Node.redefine"""
+        self._discard_name(node, node.name)
+        self._add_name(node, name)
+
+    def _has_id(self, key: str) -> bool:
+        return key in self._paths or key in self._aliases
+
+    def _resolve(self, key: str) -> Node:
+        return (self._paths.get(key) or self._aliases[key])[0][2]
+
+    def _add_name(self, node: Node, name: str):
+        key = name.casefold()
+        if (nodes := self._names.get(key)) is None:
+            self._names[key] = [node]
+            self._name_keys.add(key)
+        else:
+            nodes.append(node)
+
+    def _discard_name(self, node: Node, name: str):
+        key = name.casefold()
+        nodes = self._names[key]
+        nodes[:] = [other for other in nodes if other is not node]
+        if not nodes:
+            del self._names[key]
+            self._name_keys.discard()
+
+
+def _rank(entry: tuple[int, str, Node]) -> tuple[int, str]:
+    return entry[0], entry[1]
+
+
+def _discard_entry(
+    index: dict[str, list[tuple[int, str, Node]]], name: str, node: Node
+):
+    entries = index[name]
+    for idx, entry in enumerate(entries):
+        if entry[2] is node:
+            del entries[idx]
+            break
+    if not entries:
+        del index[name]
+
+
+class _Prefix_keys:
+    """
+    The keys of an index in sorted order, for prefix search by bisection.
+    Keys added are sorted in by the next search, keys that went are skipped until
+    there are enough of them to be worth sorting everything again.
+    """
+
+    def __init__(
+        self, present: Callable[[str], bool], every: Callable[[], Iterable[str]]
+    ) -> None:
+        self.present = present
+        self.every = every
+        self._keys: list[str] = []
+        self._added: list[str] = []
+        self._gone = 0
+
+    def add(self, key: str):
+        self._added.append(key)
+
+    def discard(self):
+        self._gone += 1
+
+    def _sorted(self) -> list[str]:
+        if self._gone > len(self._keys) // 2 + 64:
+            self._keys = sorted(self.every())
+            self._added.clear()
+            self._gone = 0
+        elif len(self._added) * 64 < len(self._keys):
+            for key in self._added:
+                insort(self._keys, key)
+            self._added.clear()
+        elif self._added:
+            # two sorted runs, which timsort merges in linear time
+            self._added.sort()
+            self._keys += self._added
+            self._keys.sort()
+            self._added.clear()
+        return self._keys
+
+    def search(self, prefix: str, k: int, fuzzy: bool = False) -> list[str]:
+        keys = self._sorted()
+        if fuzzy and len(prefix) > 1:
+            return self._fuzzy(keys, prefix, k)
+        found: list[str] = []
+        last = None
+        for at in range(bisect_left(keys, prefix), len(keys)):
+            key = keys[at]
+            if not key.startswith(prefix):
+                break
+            # keys added again after they went are in twice
+            if key != last and self.present(key):
+                found.append(key)
+                if len(found) == k:
+                    break
+            last = key
+        return found
+
+    def _fuzzy(self, keys: list[str], query: str, k: int) -> list[str]:
+        """
+        Keys starting with query give or take one typo: a letter missing, one too
+        many, a wrong one or two swapped. The keys starting with query go first.
+        """
+        found = self.search(query, k)
+        if len(found) == k:
+            return found
+        # variant -> the stretch of keys it can start
+        everywhere = (0, len(keys))
+        variants = dict.fromkeys(
+            (query[:at] + query[at + 1 :] for at in range(len(query))), everywhere
+        )
+        variants.update(
+            (query[:at] + query[at + 1] + query[at] + query[at + 2 :], everywhere)
+            for at in range(len(query) - 1)
+        )
+        # the letters that follow query[:at] in some key stand in for a missing or
+        # a wrong one, found by jumping from letter to letter in the sorted keys
+        low, high = everywhere
+        for at in range(len(query) + 1):
+            head = query[:at]
+            position = bisect_right(keys, head, low, high)  # past head itself
+            while position < high:
+                letter = keys[position][at]
+                after = bisect_left(keys, head + chr(ord(letter) + 1), position, high)
+                variants[head + letter + query[at:]] = (position, after)
+                variants[head + letter + query[at + 1 :]] = (position, after)
+                position = after
+            if at == len(query):
+                break
+            low = bisect_left(keys, head + query[at], low, high)
+            high = bisect_left(keys, head + chr(ord(query[at]) + 1), low, high)
+            if low == high:
+                break
+
+        # most variants start no key, one bisection tells
+        variants.pop(query, None)
+        starts = []
+        for variant, (low, high) in variants.items():
+            at = bisect_left(keys, variant, low, high)
+            if at < high and keys[at].startswith(variant):
+                starts.append((at, variant))
+        starts.sort()
+        need = k - len(found)
+        close: list[str] = []
+        for at, variant in starts:
+            if len(close) == need and keys[at] > close[-1]:
+                break  # the rest come later
+            close += self.search(variant, need)
+            close = sorted(set(close).difference(found))[:need]
+        return found + close
+
+
+class _Epoch:
+    """The moment a snapshot shows, kept alive by every view of that snapshot"""
+
+    __slots__ = ("time", "index", "__weakref__")
+
+    def __init__(self) -> None:
+        self.time = _Versioned._clock
+        self.index: dict[str, Node] | None = None  # see Node_manager_snapshot
+        _Versioned._clock += 1
+        live = _Versioned._live
+        live[self.time] = live.get(self.time, 0) + 1
+        weakref.finalize(self, _Epoch._release, self.time)
+
+    @staticmethod
+    def _release(time: int):
+        live = _Versioned._live
+        live[time] -= 1
+        if not live[time]:
+            del live[time]
+
+
+class _Versioned:
+    """
+    Copy-on-write for the parts of a graph that snapshots see, see Graph.dump.
+    The first change after a snapshot keeps the state it saw in _history,
+    as long as some view of that snapshot is still alive.
+    """
+
+    _clock: int = 0  # bumped by every snapshot
+    _live: dict[int, int] = {}  # time -> views of snapshots taken then
+    _logs: weakref.WeakSet[Change_log] = weakref.WeakSet()
+
+    _since: int = 0  # _clock when the current state began
+    # (until, state): the state snapshots taken before until saw, oldest first
+    _history: list[tuple[int, Any]] | None = None
+
+    def _changing(self):
+        """Call before changing the state"""
+        now = _Versioned._clock
+        if self._since == now:
+            return
+        since, self._since = self._since, now
+        if _Versioned._logs:
+            for log in _Versioned._logs:
+                log._changed[id(self)] = self
+        live = _Versioned._live
+        if not live:
+            self._history = None
+            return
+        # drop what only dead snapshots saw, keep what live ones see
+        oldest = min(live)
+        history = [entry for entry in self._history or () if entry[0] > oldest]
+        if max(live) >= since:
+            history.append((now, self._state()))
+        self._history = history or None
+
+    def _state(self) -> Any:
+        raise NotImplementedError
+
+    def _state_at(self, epoch: _Epoch) -> Any | None:
+        """The state the snapshot saw, None if it is the current one"""
+        if (history := self._history) is not None:
+            pos = bisect_right(history, epoch.time, key=itemgetter(0))
+            if pos < len(history):
+                return history[pos][1]
+        return None
+
+
+class Change_log:
+    """
+    The nodes, Node_managers and Connection_managers of any graph that change while
+    the log is alive. A node made since is only in it through the Node_manager it
+    was added to.
+    """
+
+    def __init__(self) -> None:
+        self._changed: dict[int, _Versioned] = {}
+        _Versioned._clock += 1  # so the next change of anything is logged
+        _Versioned._logs.add(self)
+
+    def take(self) -> list[_Versioned]:
+        """What changed since the log was made or last taken, emptying it"""
+        _Versioned._clock += 1
+        changed, self._changed = self._changed, {}
+        return list(changed.values())
+
+
+class Node_manager(_Versioned):
+    def __init__(self) -> None:
+        self._since = _Versioned._clock
         self._nodes: dict[str, Node] = {}
+        self._order: Callable[[Node], Any] | None = None
+        # shared by the whole tree once it is attached, see Alias_index
+        self._index: Alias_index | None = None
+        self._path = ""  # dotted path of the node these are the children of
+        self._depth = 0
 
     def add(self, node: Node):
         # if there is already that node
         if node.id in self._nodes.keys():
             raise SyntaxWarning("Redefinition of a node")
+        if self._since != _Versioned._clock:
+            self._changing()
         self._nodes[node.id] = node
+        if self._index is not None:
+            self._index.add(node, self)
+
+    def path_of(self, id: str) -> str:
+        """Dotted path of the node id in this manager"""
+        return f"{self._path}.{id}" if self._depth else id
 
     def get(self, id: str) -> Node:
         if id not in self._nodes.keys():
             raise SyntaxError("Nonexistant node")
         return self._nodes[id]
 
+    def remove(self, id: str) -> Node:
+        if id not in self._nodes.keys():
+            raise SyntaxError("Nonexistant node")
+        self._changing()
+        node = self._nodes.pop(id)
+        if self._index is not None:
+            self._index.discard(node, self)
+        return node
+
     def get_all(self) -> list[Node]:
+        if self._order is not None:
+            order = self._order
+            self._nodes = dict(sorted(self._nodes.items(), key=lambda kv: order(kv[1])))
+            self._order = None
         return list(self._nodes.values())
 
-    def find_node(self, id: str) -> Node:
-        """BFS for node with an alias of id"""
-        nd = self.get(id)
-        frontier: list[Node] = [nd]
+    def last(self) -> Node | None:
+        """The most recently added node"""
+        return next(reversed(self._nodes.values()), None)
 
-        while len(frontier):
-            node = frontier.pop(0)
-            if node.id == id:
-                return node
-            frontier.extend(node.children.get_all())
+    def reorder(self, key: Callable[[Node], Any]):
+        """Sort the nodes by key the next time they are listed"""
+        self._changing()
+        self._order = key
 
-        raise RuntimeError("Not a thing")
+    def _state(self) -> dict[str, Node]:
+        self.get_all()  # sorted, if it has to be
+        return dict(self._nodes)
 
+    def find_node(self, id: str) -> Node:
+        """Node with the dotted path or alias id, resolved as Alias_index describes"""
+        if (node := self.lookup(id)) is None:
+            raise SyntaxError("Nonexistant node")
+        return node
+
+    def lookup(self, id: str) -> Node | None:
+        """find_node, but None when there is no such node"""
+        if self._index is not None and not self._depth:
+            return self._index.find(id)
+        return self._search(id)
+
+    def descendants(self) -> Iterator[Node]:
+        """Every node under this manager, breadth first"""
+        frontier = deque([self])
+        while frontier:
+            for node in frontier.popleft().get_all():
+                yield node
+                frontier.append(node.children)
+
+    def _search(self, id: str) -> Node | None:
+        """find_node for managers without an index, paths are relative to this one"""
+        alias_match: tuple[int, str, Node] | None = None
+        frontier: deque[tuple[int, str, Node]] = deque(
+            (0, node.id, node) for node in self._nodes.values()
+        )
+        while frontier:
+            entry = frontier.popleft()
+            depth, path, node = entry
+            if path == id:
+                return node
+            if node.id == id and depth:
+                if alias_match is None or _rank(entry) < _rank(alias_match):
+                    alias_match = entry
+            frontier.extend(
+                (depth + 1, f"{path}.{child.id}", child)
+                for child in node.children._nodes.values()
+            )
+        return alias_match[2] if alias_match is not None else None
 
-class Connection_manager:
+
+class Connection_manager(_Versioned):
     def __init__(self) -> None:
+        self._since = _Versioned._clock
         self._conns: dict[str, list[Node]] = {}
 
     def add(self, conn_type: str, nodes: list[Node]):
+        if self._since != _Versioned._clock:
+            self._changing()
         if conn_type not in self._conns.keys():
             self._conns[conn_type] = []
         self._conns[conn_type].extend(nodes)
 
+    def _state(self) -> dict[str, list[Node]]:
+        return {conn_type: list(nodes) for conn_type, nodes in self._conns.items()}
+
 
 @dataclass
-class Node:
+class Node(_Versioned):
     id: str
     name: str
     content: str
     children: Node_manager = field(default_factory=Node_manager)
     connections: Connection_manager = field(default_factory=Connection_manager)
 
+    def __post_init__(self):
+        self._since = _Versioned._clock
+
+    def __setattr__(self, name: str, value: Any):
+        # writing a field directly is a change too, once the node is made
+        if name in _NODE_STATE and "_since" in self.__dict__:
+            self._changing()
+        self.__dict__[name] = value
+
+    def redefine(self, name: str, content: str):
+        self._changing()
+        if (index := self.children._index) is not None and name != self.name:
+            index.rename(self, name)
+        self.name = name
+        self.content = content
+
+    def _state(self) -> tuple[str, str]:
+        return self.name, self.content
+
+
+_NODE_STATE = frozenset(("name", "content"))  # what Node._state keeps
+
+
+class Node_snapshot:
+    """Read-only view of a Node as it was when Graph.dump was called"""
+
+    __slots__ = ("_node", "_epoch")
+
+    def __init__(self, node: Node, epoch: _Epoch) -> None:
+        self._node = node
+        self._epoch = epoch
+
+    @property
+    def id(self) -> str:
+        return self._node.id
+
+    @property
+    def name(self) -> str:
+        state = self._node._state_at(self._epoch)
+        return state[0] if state is not None else self._node.name
+
+    @property
+    def content(self) -> str:
+        state = self._node._state_at(self._epoch)
+        return state[1] if state is not None else self._node.content
+
+    @property
+    def children(self) -> Node_manager_snapshot:
+        return Node_manager_snapshot(self._node.children, self._epoch)
+
+    @property
+    def connections(self) -> Connection_manager_snapshot:
+        return Connection_manager_snapshot(self._node.connections, self._epoch)
+
+    def __repr__(self) -> str:
+        return (
+            f"Node_snapshot(id={self.id!r}, name={self.name!r}, "
+            f"content={self.content!r})"
+        )
+
+
+class Node_manager_snapshot(Node_manager):
+    """
+    Read-only view of a Node_manager as it was when Graph.dump was called.
+    Views are made as they are asked for, the first lookup from the top indexes
+    every node the snapshot sees, once for the whole snapshot.
+    """
+
+    def __init__(self, manager: Node_manager, epoch: _Epoch) -> None:
+        self._manager = manager
+        self._epoch = epoch
+        self._order = None
+        self._index = None
+        self._path = manager._path
+        self._depth = manager._depth
+        self._view: dict[str, Node_snapshot] | None = None
+
+    def _seen(self, manager: Node_manager | None = None) -> dict[str, Node]:
+        """The nodes of manager (this one's by default) as the snapshot sees them"""
+        manager = manager or self._manager
+        if (nodes := manager._state_at(self._epoch)) is None:
+            manager.get_all()  # sorted, if it has to be
+            nodes = manager._nodes
+        return nodes
+
+    @property
+    def _nodes(self) -> dict[str, Node_snapshot]:  # type: ignore[override]
+        if self._view is None:
+            epoch = self._epoch
+            seen = self._seen()
+            self._view = {id: Node_snapshot(node, epoch) for id, node in seen.items()}
+        return self._view
+
+    def get(self, id: str) -> Node_snapshot:  # type: ignore[override]
+        if (node := self._nodes.get(id)) is None:
+            raise SyntaxError("Nonexistant node")
+        return node
+
+    def get_all(self) -> list[Node_snapshot]:  # type: ignore[override]
+        return list(self._nodes.values())
+
+    def lookup(self, id: str) -> Node_snapshot | None:  # type: ignore[override]
+        if self._depth:
+            return self._search(id)
+        # the index holds nodes, not views, which would keep the epoch alive
+        if (index := self._epoch.index) is None:
+            index = self._epoch.index = self._index_all()
+        node = index.get(id)
+        return Node_snapshot(node, self._epoch) if node is not None else None
+
+    def _walk(self) -> Iterator[tuple[int, str, Node]]:
+        """(depth, path, node) for every node under this one, breadth first"""
+        frontier = deque((0, id, node) for id, node in self._seen().items())
+        while frontier:
+            entry = frontier.popleft()
+            yield entry
+            depth, path, node = entry
+            frontier.extend(
+                (depth + 1, f"{path}.{id}", child)
+                for id, child in self._seen(node.children).items()
+            )
+
+    def _search(self, id: str) -> Node_snapshot | None:  # type: ignore[override]
+        alias_match: tuple[int, str, Node] | None = None
+        for entry in self._walk():
+            depth, path, node = entry
+            if path == id:
+                return Node_snapshot(node, self._epoch)
+            if node.id == id and depth:
+                if alias_match is None or _rank(entry) < _rank(alias_match):
+                    alias_match = entry
+        return Node_snapshot(alias_match[2], self._epoch) if alias_match else None
+
+    def _index_all(self) -> dict[str, Node]:
+        """What every name resolves to, the way _search resolves it"""
+        paths: dict[str, Node] = {}
+        aliases: dict[str, tuple[int, str, Node]] = {}
+        for entry in self._walk():
+            depth, path, node = entry
+            paths.setdefault(path, node)
+            if depth and (
+                (found := aliases.get(node.id)) is None or _rank(entry) < _rank(found)
+            ):
+                aliases[node.id] = entry
+        index = {id: entry[2] for id, entry in aliases.items()}
+        index.update(paths)
+        return index
+
+    def add(self, node: Node):
+        raise TypeError("Snapshots are read-only")
+
+    def remove(self, id: str) -> Node:
+        raise TypeError("Snapshots are read-only")
+
+    def reorder(self, key: Callable[[Node], Any]):
+        raise TypeError("Snapshots are read-only")
+
+
+class Connection_manager_snapshot:
+    """Read-only view of a Connection_manager as it was when Graph.dump was called"""
+
+    __slots__ = ("_manager", "_epoch")
+
+    def __init__(self, manager: Connection_manager, epoch: _Epoch) -> None:
+        self._manager = manager
+        self._epoch = epoch
+
+    @property
+    def _conns(self) -> dict[str, list[Node_snapshot]]:
+        epoch = self._epoch
+        if (conns := self._manager._state_at(epoch)) is None:
+            conns = self._manager._conns
+        return {
+            conn_type: [Node_snapshot(node, epoch) for node in nodes]
+            for conn_type, nodes in conns.items()
+        }
+
+
+_KEY_GAP = 1 << 20  # room between the keys of neighbouring lines
+
+
+@dataclass(eq=False, slots=True)
+class _Line:
+    """A line of an incrementally parsed document and the graph facts it produced"""
+
+    text: str
+    token: Token | None
+    key: int  # orders lines, see Graph.apply_edit
+    nodes: list[tuple[Node_manager, Node]] = field(default_factory=list)
+    edge: tuple[Node, str, list[Node]] | None = None  # origin, connection, targets
+
+
+class Unresolved_reference(NamedTuple):
+    name: str  # what the connection points at
+    origin: str  # where the connection starts, as written
+    connection: str
+    line: int
+    file: str | None = None
+    position: int = 0  # which of the connection's targets it is
+
+
+class Symbol_table:
+    """
+    Connection targets that aren't defined, each gets a single placeholder node.
+    Placeholders are swapped for the real node once one gets defined, see resolve.
+    """
+
+    def __init__(self) -> None:
+        self._placeholders: dict[str, Node] = {}
+        # where each placeholder sits in a connection list, to patch it
+        self._slots: dict[str, list[tuple[Connection_manager, list[Node], int]]] = {}
+        # origin, connection, line (or _Line while parsing incrementally), file,
+        # position, see Unresolved_reference
+        self._refs: dict[str, list[tuple[str, str, Any, str | None, int]]] = {}
+
+    def intern(self, name: str) -> Node:
+        if (node := self._placeholders.get(name)) is None:
+            node = self._placeholders[name] = Node(name, name, name)
+            self._slots[name] = []
+            self._refs[name] = []
+        return node
+
+    def is_placeholder(self, node: Node) -> bool:
+        return self._placeholders.get(node.id) is node
+
+    def refer(
+        self,
+        name: str,
+        ref: tuple[str, str, Any, str | None, int],
+        slot: tuple[Connection_manager, list[Node], int] | None = None,
+    ):
+        """Note a use of the placeholder for name, slot is where it was put"""
+        self._refs[name].append(ref)
+        if slot is not None:
+            self._slots[name].append(slot)
+
+    def forget(self, name: str, where: Any):
+        """Drop the uses of name from where, and the placeholder once it isn't used"""
+        refs = [ref for ref in self._refs[name] if ref[2] is not where]
+        self._refs[name] = refs
+        if not refs:
+            del self._placeholders[name], self._slots[name], self._refs[name]
+
+    def resolve(self, find: Callable[[str], Node | None]):
+        """Patch every placeholder whose name find now knows"""
+        for name in [name for name in self._placeholders if find(name) is not None]:
+            node = find(name)
+            for manager, conns, idx in self._slots[name]:
+                manager._changing()
+                conns[idx] = node
+            del self._placeholders[name], self._slots[name], self._refs[name]
+
+    def unresolved(self) -> list[Unresolved_reference]:
+        return [
+            Unresolved_reference(name, *ref)
+            for name, refs in self._refs.items()
+            for ref in refs
+        ]
+
+
+def _line_key(line: _Line) -> int:
+    return line.key
+
+
+def _chain_depth(token: Token | None) -> int | None:
+    """
+    How deep on the chain a line puts its node: 0 for definitions, the number of
+    < for continuations, -1 for invalid lines that clear it, None for the rest
+    """
+    if token is None:
+        return None
+    kind = token.kind
+    if kind is Token_kind.DEFINE:
+        return 0
+    if kind is Token_kind.CONTINUE:
+        return token.fields[0]
+    if kind is Token_kind.INVALID:
+        return -1
+    return None
+
+
+def _chain_shape(lines: list[_Line]) -> list[tuple[int, str]]:
+    """Depth and alias of the lines that change the chain, see _chain_depth"""
+    shape = []
+    for line in lines:
+        if (depth := _chain_depth(line.token)) is not None:
+            alias = line.token.fields[1 if depth > 0 else 0] if depth != -1 else ""
+            shape.append((depth, alias))
+    return shape
+
+
+def _lookups(line: _Line) -> set[str]:
+    """Names of the nodes a line needs to find"""
+    if line.token is None:
+        return set()
+    if line.token.kind is Token_kind.CONNECT:
+        left, _, *targets = line.token.fields
+        return {left, *targets}
+    if line.token.kind is Token_kind.ELABORATE:
+        return {line.token.fields[0]}
+    return set()
+
+
+# what Parse_stats calls each kind of line
+_LINE_KINDS = {
+    Token_kind.DEFINE: "definition",
+    Token_kind.ELABORATE: "elaboration",
+    Token_kind.CONTINUE: "continuation",
+    Token_kind.CONNECT: "connection",
+    Token_kind.ANNOTATION: "annotation",
+    Token_kind.INVALID: "invalid",
+}
+
+Tracer = Callable[[str, Token, float], None]
+
+
+@dataclass
+class Parse_stats:
+    """What the parses of an instrumented Graph did, see Graph.instrument"""
+
+    lines: dict[str, int] = field(default_factory=dict)  # line kind -> lines
+    seconds: dict[str, float] = field(default_factory=dict)  # line kind -> time
+    find_node_calls: int = 0  # names resolved against the graph
+    visited_nodes: int = 0  # nodes those lookups looked at
+    placeholders: int = 0  # placeholder nodes made for undefined targets
+
+    def snapshot(self) -> Parse_stats:
+        """A copy that later parses don't change"""
+        return Parse_stats(**asdict(self))
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(asdict(self), **kwargs)
+
+    def _count(self, kind: str, seconds: float):
+        self.lines[kind] = self.lines.get(kind, 0) + 1
+        self.seconds[kind] = self.seconds.get(kind, 0.0) + seconds
+
 
 class Graph:
     def __init__(self, nodes: Node_manager | None = None) -> None:
         self.nodes: Node_manager = nodes or Node_manager()
+        self.aliases = Alias_index()
+        self.aliases.attach(self.nodes)
+        # connections waiting for the end of the input, see link()
+        self._deferred: list[tuple[Token, str | None, str | None]] = []
+        self.symbols = Symbol_table()
+        # bumped whenever connections may have changed, see Causal_query
+        self._version = 0
+        self._query: Causal_query | None = None
+        # counters, see instrument()
+        self._stats: Parse_stats | None = None
+        self._tracer: Tracer | None = None
+        # the last definition, then the node of the last < line under it, of the
+        # last << line and so on: what a continuation of each depth goes under
+        self._chain: list[Node] = []
+
+        # incremental parsing, see apply_edit()
+        self._lines: list[_Line] | None = None
+        self._current: _Line | None = None  # line being applied
+        self._made_by: dict[int, _Line] = {}  # id(node) -> line that added it
+        self._refs: dict[str, set[_Line]] = {}  # name -> lines looking it up
+        self._edges: dict[int, dict[str, list[_Line]]] = {}  # id(origin) -> lines
+        self._touched: set[str] = set()  # names of nodes added or removed
+        # (id(manager), node id) -> manager, node, key of its line (None if moving)
+        self._stash: (
+            dict[tuple[int, str], tuple[Node_manager, Node, int | None]] | None
+        ) = None
+        self._placed: dict[int, int] = {}
 
     def format_debug_info(self, debug_info: dict[str, Any]) -> str:
         ret = ""
@@ -172,110 +1187,826 @@ class Graph:
 
         return ret
 
-    def parse(self, code: str):
-        lines = [line.strip() for line in code.split("\n") if line.strip() != ""]
-        for idx, line in enumerate(lines):
-            # DEBUG INFO
-            # context
-            context_size = 3
-            context = "".join(
-                [
-                    # |line#| line
-                    format_str(f"\n|{j + 1}| {lines[j]}", underline=(idx == j))
-                    # j - context size -> j + context size
-                    for j in range(idx - context_size, idx + context_size + 1)
-                    # if j in range
-                    if j >= 0 and j < len(lines)
-                ]
-            )
-
-            debug_info = {"context": context}
+    def format_context(self, span: Source_span, context_size: int = 3) -> str:
+        """The lines around span, only built once something needs to be reported"""
+        return _format_context(span, context_size)
+
+    def parse(
+        self,
+        code: str,
+        debug: bool = True,
+        file: str | None = None,
+        incremental: bool = False,
+        recover: bool = False,
+        max_errors: int | None = None,
+    ) -> list[Diagnostic] | None:
+        """
+        Parse code line by line, debug=False reports errors without their context.
+        incremental=True remembers what each line added so apply_edit can be used.
+        recover=True skips the lines with errors instead of stopping at the first
+        one and returns them as Diagnostics, parsing stops after max_errors errors.
+        """
+        self._chain = []  # code continues nothing parsed before it
+        if recover:
+            if incremental:
+                raise ValueError("recover can't be used with incremental")
+            tokens = ((token, code) for token in tokenize(code))
+            return self._recover(tokens, file, max_errors)
+        if incremental:
+            if self._lines is None:
+                self._lines = []
+            return self.apply_edit(len(self._lines), len(self._lines), code, file)
+
+        source = code if debug else None
+        for token in tokenize(code):
+            self.parse_token(token, source, file)
+        self.link()
+
+    def parse_stream(
+        self,
+        lines: Iterable[str],
+        debug: bool = True,
+        file: str | None = None,
+        recover: bool = False,
+        max_errors: int | None = None,
+    ) -> list[Diagnostic] | None:
+        """Parse lines as they come in, only the graph is kept in memory"""
+        self._chain = []
+        tokens = _stream_tokens(lines)
+        if recover:
+            return self._recover(tokens, file, max_errors)
+        for token, line in tokens:
+            self.parse_token(token, line if debug else None, file)
+        self.link()
+        return None
+
+    def _recover(
+        self,
+        tokens: Iterable[tuple[Token, str]],
+        file: str | None,
+        max_errors: int | None,
+    ) -> list[Diagnostic]:
+        """Parse (token, source) pairs, skipping and reporting the ones with errors"""
+        diagnostics = _Diagnostics(max_errors)
+        for token, source in tokens:
+            if diagnostics.full:
+                break
+            if token.kind is Token_kind.INVALID:
+                message = "Invalid syntax"
+                diagnostics.report(Severity.ERROR, message, token, source, file)
+                self._chain = []  # it may have been meant as a definition
+                continue
+            try:
+                self._apply(token, source, file)
+            except SyntaxWarning as e:
+                diagnostics.report(Severity.WARNING, str(e), token, source, file)
+            except SyntaxError as e:
+                message = getattr(e, "message", str(e))  # see raise_error
+                diagnostics.report(Severity.ERROR, message, token, source, file)
+        self.link(diagnostics)
+        # connections are reported when they are linked, after every other line
+        return sorted(diagnostics.found, key=lambda found: found.span.line)
+
+    def parse_file(
+        self,
+        path: str,
+        debug: bool = True,
+        use_mmap: bool = False,
+        encoding: str = "utf-8",
+        cache: Parse_cache | None = None,
+        recover: bool = False,
+        max_errors: int | None = None,
+    ) -> list[Diagnostic] | None:
+        """
+        Stream a file through parse_stream, use_mmap reads it through a memory map.
+        With a cache, a file parsed into an empty graph before is loaded from it,
+        otherwise it is streamed and hashed again as it is read, and stored if it
+        didn't change in between.
+        recover and max_errors are passed on, a recovering parse skips the cache.
+        """
+        stream = partial(
+            self.parse_stream, debug=debug, recover=recover, max_errors=max_errors
+        )
+        # what the file means depends on what is already in the graph otherwise
+        if (
+            cache is not None
+            and not recover
+            and not (self.nodes._nodes or self._deferred or self._lines is not None)
+        ):
+            key = cache.key_file(path, encoding)
+            if (cached := cache.get(key)) is not None:
+                self._adopt(cached, path)
+                return None
+            digest = cache.hasher(encoding)
+            with open(path, "rb") as f:
+                stream(
+                    (line.decode(encoding) for line in _hashed(f, digest)), file=path
+                )
+            if digest.hexdigest() == key:
+                cache.put(key, self)
+            return None
+
+        if not use_mmap:
+            with open(path, "rt", encoding=encoding) as f:
+                return stream(f, file=path)
+
+        with open(path, "rb") as f:
+            if not f.seek(0, 2):
+                return stream((), file=path)  # empty files can't be mapped
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                lines = (line.decode(encoding) for line in iter(mm.readline, b""))
+                return stream(lines, file=path)
+
+    def _adopt(self, cached: tuple[Compact_graph, list[Unresolved_reference]], file):
+        """Take over the nodes of a cached parse"""
+        compact, refs = cached
+        graph = compact.to_graph()
+        self.nodes, self.aliases = graph.nodes, graph.aliases
+        self.symbols = graph.symbols
+        self._version += 1
+        if self._stats is not None:
+            self._hook()
+        # the references of the parse, with their lines
+        with _gc_paused():
+            for name in self.symbols._refs:
+                self.symbols._refs[name] = []
+            for ref in refs:
+                where = (ref.origin, ref.connection, ref.line, file, ref.position)
+                self.symbols.refer(ref.name, where)
+
+    def link(self, diagnostics: _Diagnostics | None = None):
+        """
+        Resolve the connections parsed so far against every node defined so far.
+        Connections wait for this, so they can point at nodes defined further down.
+        With diagnostics, connections from undefined nodes are reported there.
+        """
+        self._version += 1
+        self.symbols.resolve(self.nodes.lookup)
+        deferred, self._deferred = self._deferred, []
+        for token, source, file in deferred:
+            if diagnostics is None:
+                self.link_token(token, source, file)
+            elif (edge := self._connect(token)) is None:
+                diagnostics.report(
+                    Severity.ERROR, "Undefined node", token, cast(str, source), file
+                )
+            else:
+                self._link_edge(edge, token, file)
 
-            # parsing
-            self.parse_line(line, debug_info)
+    @handle_notelang_exception
+    def link_token(
+        self, token: Token, source: str | None = None, file: str | None = None
+    ):
+        if (edge := self._connect(token)) is None:
+            self.raise_error("Undefined node", token, source, file)
+        self._link_edge(edge, token, file)
+
+    def _link_edge(
+        self, edge: tuple[Node, str, list[Node]], token: Token, file: str | None
+    ):
+        origin, connection, dests = edge
+        conns = origin.connections
+        base = len(conns._conns.get(connection, ()))
+        conns.add(connection, dests)
+        for idx, nd in enumerate(dests):
+            if self.symbols.is_placeholder(nd):
+                ref = (token.fields[0], connection, token.line, file, idx)
+                slot = (conns, conns._conns[connection], base + idx)
+                self.symbols.refer(nd.id, ref, slot)
+
+    def unresolved(self) -> list[Unresolved_reference]:
+        """Connection targets that no node was defined for, as of the last link()"""
+        refs = self.symbols.unresolved()
+        if self._lines is not None:
+            lines = {id(line): idx + 1 for idx, line in enumerate(self._lines)}
+            refs = [ref._replace(line=lines[id(ref.line)]) for ref in refs]
+        return sorted(refs, key=lambda ref: (ref.file or "", ref.line, ref.position))
+
+    def parse_line(self, line: str, span: Source_span | None = None):
+        token = _lex_line(line, 0, len(line), span.line if span else 1)
+        if span is not None:
+            # report errors against where the line came from
+            token = token._replace(start=span.start, end=span.end)
+            self.parse_token(token, span.source, span.file)
+        else:
+            self.parse_token(token)
+        self.link()
 
     @handle_notelang_exception
-    def parse_line(self, line: str, debug_info: dict[str, Any]):
+    def parse_token(
+        self, token: Token, source: str | None = None, file: str | None = None
+    ):
+        """Add the graph facts of one token, source is the buffer it was scanned from"""
+        self._apply(token, source, file)
+
+    def _apply(self, token: Token, source: str | None = None, file: str | None = None):
+        kind = token.kind
         # annotation
-        if line[0:1] == "#":
+        if kind is Token_kind.ANNOTATION:
             return
-        # definition
-        if (idx := line.find(":")) != -1:
-            left = line[:idx].strip(" ")
-            right = line[idx + 1 :].strip(" ")
-
-            # check for alias
-            if left[-1] == ")":
-                alias = left[left.rfind("(") :][1:-1]
-            else:
-                alias = ""
-            alias.strip(" ")
-            name = left[: left.rfind("(")].strip(" ")
 
-            if not len(alias):
-                alias = name
+        # definition
+        if kind is Token_kind.DEFINE:
+            alias, name, content = token.fields
+            self._chain = []
+            self._chain.append(self._add_node(self.nodes, Node(alias, name, content)))
+            return
 
-            content = right.strip(" ")
+        # continuations, the parent is already on the chain
+        if kind is Token_kind.CONTINUE:
+            depth, alias, content = token.fields
+            chain = self._chain
+            if depth > len(chain):
+                self._chain = []
+                if not chain:
+                    msg = "Nothing to continue, < goes under a definition"
+                else:
+                    msg = (
+                        f"Nesting too deep, {'<' * depth} needs a {'<' * (depth - 1)}"
+                        f" line above it, {'<' * len(chain)} is as deep as it can go"
+                        " here"
+                    )
+                self.raise_error(msg, token, source, file)
+            parent = chain[depth - 1]
+            del chain[depth:]
+            chain.append(self._add_node(parent.children, Node(alias, alias, content)))
+            return
 
-            nd = Node(alias, name, content)
-            self.nodes.add(nd)
+        # elaborations
+        if kind is Token_kind.ELABORATE:
+            parent, alias, content = token.fields
+            nd = self._find_parent(parent)
+            self._add_node(nd.children, Node(alias, alias, content))
+            return
 
-            # print(f"alias: {alias}")
-            # print(f"content: {content}")
-            # print(f"node: {nd}")
+        # logical connection, resolved by link()
+        if kind is Token_kind.CONNECT:
+            self._deferred.append((token, source, file))
             return
 
-        # elaborations
-        idx0 = line.find("<")
-        idx1 = line.find(">")
-        # if there is not an occurance of > or if > is before <, then it's an elaboration
-        if idx0 != -1 and idx1 == -1 or idx1 < idx0:
-            # elaboration
-            left = line[:idx0].strip(" ")
-            right = line[idx0 + 1 :].strip(" ")
-
-            # find sub alias
-            if right[0] == "(":
-                alias = right[1 : right.find(")")]
+        self.raise_error("Invalid syntax", token, source, file)
+
+    def _connect(self, token: Token) -> tuple[Node, str, list[Node]] | None:
+        left, connection, *targets = token.fields
+        if (origin := self.nodes.lookup(left)) is None:
+            return None
+        lookup = self.nodes.lookup
+        intern = self.symbols.intern
+        dests = [lookup(txt) or intern(txt) for txt in targets]
+        return origin, connection, dests
+
+    def raise_error(
+        self, msg: str, token: Token, source: str | None = None, file: str | None = None
+    ):
+        # DEBUG INFO
+        debug_info = {}
+        if source is not None:
+            debug_info["context"] = self.format_context(token.span(source, file))
+        error = nodelang_exception(SyntaxError)(
+            f"{format_str(msg, LIGHTRED, bold=True)}\n{self.format_debug_info(debug_info)}"
+        )
+        error.message = msg  # without the formatting, for diagnostics
+        raise error
+
+    # === Incremental parsing ===
+
+    def apply_edit(
+        self, start_line: int, end_line: int, new_text: str, file: str | None = None
+    ):
+        """
+        Replace lines [start_line, end_line) of the document, counted from 0, with
+        the lines of new_text ("" removes them). Only the edited lines and the lines
+        that look up a node the edit added or removed get parsed again.
+        The graph ends up the same as parsing the edited document from scratch.
+        If the edited document has an error, it is raised and the graph is left as
+        the document was. Invalid lines are found before anything changes, for other
+        errors the document is parsed again and its nodes are new objects then.
+        """
+        if self._lines is None:
+            raise RuntimeError("Graph was not parsed with incremental=True")
+        self._version += 1
+        lines = self._lines
+        texts = new_text.split("\n")
+        if not texts[-1]:
+            texts.pop()  # new_text ended with a line break
+
+        # keys keep document order without renumbering every line after the edit
+        lo = lines[start_line - 1].key if start_line > 0 else 0
+        if end_line < len(lines):
+            hi = lines[end_line].key
+        else:
+            hi = lo + _KEY_GAP * (len(texts) + 1)
+        if hi - lo <= len(texts):
+            gap = max(_KEY_GAP, len(texts) + 1)
+            for idx, line in enumerate(lines):
+                line.key = (idx + 1) * gap
+            lo = start_line * gap
+            hi = lo + gap * (end_line - start_line + 1)
+        step = (hi - lo) // (len(texts) + 1)
+
+        new = []
+        for idx, text in enumerate(texts):
+            start, end = _LINE.match(text).span(1)
+            token = None
+            if start != -1:
+                token = _lex_line(text, start, end, start_line + idx + 1)
+            new.append(_Line(text, token, lo + step * (idx + 1)))
+        for line in new:
+            if line.token is not None and line.token.kind is Token_kind.INVALID:
+                self.raise_error("Invalid syntax", line.token, line.text, file)
+
+        old = lines[start_line:end_line]
+        lines[start_line:end_line] = new
+        try:
+            self._edit(start_line, old, new, file)
+        except BaseException:
+            lines[start_line : start_line + len(new)] = old
+            self._restore([line.text for line in lines], file)
+            raise
+
+    def _edit(self, start_line: int, old: list[_Line], new: list[_Line], file):
+        """Parse the lines new, put in place of the lines old at start_line"""
+        # take back what the old lines added, keeping their nodes aside so lines
+        # that define the same node again can update it in place
+        self._touched = set()
+        self._stash = {}
+        self._placed = {}
+        relink: set[_Line] = set()
+        for line in reversed(old):
+            self._retract(line)
+            self._forget(line)
+        if _chain_shape(old) != _chain_shape(new):
+            # the continuation lines after the edit may go under other nodes now,
+            # their nodes are taken back first so the new lines can't run into them
+            after = start_line + len(new)
+            for line in reversed(list(self._continuations(after))):
+                self._retract(line, moving=True)
+
+        self._chain = self._chain_at(start_line)
+        for line in new:
+            self._remember(line)
+            if line.token is None:
+                continue
+            if line.token.kind is Token_kind.CONNECT:
+                relink.add(line)
             else:
-                alias = ""
-            alias.strip(" ")
-            content = right[right.find(")") + 1 :].strip(" ")
+                self._apply_line(line, file)
+        self._continue_chain(start_line + len(new), file)
+
+        # lines before or after the edit only need re-parsing if a node they look
+        # up has changed, which doesn't include the nodes the edit just updated
+        edited = set(new)
+        touched = self._touched
+        for manager, node, _ in self._stash.values():
+            manager.remove(node.id)
+            touched.update((node.id, manager.path_of(node.id)))
+        self._stash = None
+        self._settle(touched, edited, relink, file)
+
+    def _restore(self, texts: list[str], file: str | None):
+        """Parse the document texts again after an edit of it failed half way"""
+        graph = Graph()
+        graph._lines = []
+        graph.apply_edit(0, 0, "".join(f"{text}\n" for text in texts), file)
+        self.nodes, self.aliases = graph.nodes, graph.aliases
+        self.symbols = graph.symbols
+        self._deferred, self._chain = graph._deferred, graph._chain
+        self._lines, self._made_by = graph._lines, graph._made_by
+        self._refs, self._edges = graph._refs, graph._edges
+        self._current, self._stash, self._touched = None, None, set()
+        self._placed = {}
+        self._version += 1
+        if self._stats is not None:
+            self._hook()
+
+    def _chain_at(self, index: int) -> list[Node]:
+        """The chain as parsing left it before line index, see _apply"""
+        chain: dict[int, Node] = {}
+        lines = self._lines
+        for idx in range(index - 1, -1, -1):
+            line = lines[idx]
+            if (depth := _chain_depth(line.token)) is None:
+                continue
+            if depth == -1 or not line.nodes:
+                return []  # nothing to continue from there on
+            if not chain or depth < min(chain):
+                chain[depth] = line.nodes[0][1]
+                if not depth:
+                    break
+        depths = sorted(chain)
+        if depths != list(range(len(depths))):
+            return []
+        return [chain[depth] for depth in depths]
+
+    def _continuations(self, index: int) -> Iterator[_Line]:
+        """The continuation lines from index on, up to the next definition"""
+        lines = self._lines
+        for idx in range(index, len(lines)):
+            line = lines[idx]
+            if (depth := _chain_depth(line.token)) is None:
+                continue
+            if depth < 1:
+                return
+            yield line
+
+    def _continue_chain(self, index: int, file: str | None):
+        """
+        Move the continuation lines from index on under the nodes the chain now
+        has, up to the next definition which starts a new chain
+        """
+        for line in self._continuations(index):
+            depth = line.token.fields[0]
+            chain = self._chain
+            if depth <= len(chain) and line.nodes:
+                if line.nodes[0][0] is chain[depth - 1].children:
+                    del chain[depth:]
+                    chain.append(line.nodes[0][1])
+                    continue
+            self._retract(line)
+            self._apply_line(line, file)
+
+    def _settle(
+        self,
+        touched: set[str],
+        edited: set[_Line],
+        relink: set[_Line],
+        file: str | None,
+    ):
+        while touched:
+            self._touched = set()
+            affected = set().union(*(self._refs.get(name, ()) for name in touched))
+            for line in sorted(affected - edited, key=_line_key):
+                if line.token.kind is Token_kind.CONNECT:
+                    relink.add(line)
+                    continue
+                # elaboration of a node that was added or removed
+                parent = self.aliases.find(line.token.fields[0], self._before(line))
+                if line.nodes and parent is not None:
+                    if line.nodes[0][0] is parent.children:
+                        continue
+                self._retract(line)
+                self._apply_line(line, file)
+            touched = self._touched
+            edited = set()
+
+        dirty: dict[int, Node] = {}
+        for line in relink:
+            if line.edge is not None:
+                self._unlink(line, dirty)
+        for line in sorted(relink, key=_line_key):
+            if (edge := self._connect(line.token)) is None:
+                token = line.token._replace(line=self._lines.index(line) + 1)
+                self.raise_error("Undefined node", token, line.text, file)
+            line.edge = edge
+            self._edges.setdefault(id(edge[0]), {}).setdefault(edge[1], []).append(line)
+            dirty[id(edge[0])] = edge[0]
+            for idx, nd in enumerate(edge[2]):
+                if self.symbols.is_placeholder(nd):
+                    ref = (line.token.fields[0], edge[1], line, file, idx)
+                    self.symbols.refer(nd.id, ref)
+        for origin in dirty.values():
+            self._rebuild_connections(origin)
+
+    def _apply_line(self, line: _Line, file: str | None):
+        self._current = line
+        try:
+            self._apply(line.token, line.text, file)
+        finally:
+            self._current = None
+
+    def _add_node(self, manager: Node_manager, node: Node) -> Node:
+        """Add node to manager, returns it or the node it was defined again as"""
+        line = self._current
+        if line is None:
+            manager.add(node)
+            return node
+
+        # nodes stay where they are in the manager when they are defined again and
+        # new ones go last, anything else has to be sorted back into document order
+        placed = self._placed.get(id(manager))  # last key placed, -1 for new nodes
+        kept = self._stash.pop((id(manager), node.id), None) if self._stash else None
+        if kept is not None:
+            # same node defined again, lines pointing at it stay valid
+            _, stashed, old_key = kept
+            if (stashed.name, stashed.content) != (node.name, node.content):
+                stashed.redefine(node.name, node.content)
+            node = stashed
+            if old_key is None:
+                manager.reorder(self._node_key)
+                old_key = -1
+            elif placed is not None and (placed == -1 or placed > old_key):
+                manager.reorder(self._node_key)
+            self._placed[id(manager)] = old_key
+        else:
+            last = manager.last()
+            if last is not None and (
+                id(last) not in self._made_by or self._node_key(last) > line.key
+            ):
+                manager.reorder(self._node_key)
+            manager.add(node)
+            self._touched.update((node.id, manager.path_of(node.id)))
+            self._placed[id(manager)] = -1
+        self._made_by[id(node)] = line
+        line.nodes.append((manager, node))
+        return node
+
+    def _retract(self, line: _Line, moving: bool = False):
+        # moving lines may be defined again anywhere, their key says nothing then
+        key = None if moving else line.key
+        for manager, node in reversed(line.nodes):
+            del self._made_by[id(node)]
+            if self._stash is not None:
+                self._stash[(id(manager), node.id)] = (manager, node, key)
+            else:
+                manager.remove(node.id)
+                self._touched.update((node.id, manager.path_of(node.id)))
+        line.nodes = []
+
+    def _remember(self, line: _Line):
+        """Index the names the line looks up"""
+        for name in _lookups(line):
+            self._refs.setdefault(name, set()).add(line)
+
+    def _forget(self, line: _Line):
+        for name in _lookups(line):
+            refs = self._refs[name]
+            refs.discard(line)
+            if not refs:
+                del self._refs[name]
+        if line.edge is not None:
+            dirty: dict[int, Node] = {}
+            self._unlink(line, dirty)
+            for origin in dirty.values():
+                self._rebuild_connections(origin)
+
+    def _unlink(self, line: _Line, dirty: dict[int, Node]):
+        origin, connection, dests = line.edge
+        for nd in dests:
+            if self.symbols.is_placeholder(nd):
+                self.symbols.forget(nd.id, line)
+        by_type = self._edges[id(origin)]
+        by_type[connection].remove(line)
+        if not by_type[connection]:
+            del by_type[connection]
+        if not by_type:
+            del self._edges[id(origin)]
+        line.edge = None
+        dirty[id(origin)] = origin
+
+    def _rebuild_connections(self, origin: Node):
+        """Lay out origin's connections in the order a full parse would link them"""
+        by_type = self._edges.get(id(origin), {})
+        conns = Connection_manager()
+        for connection, lines in sorted(
+            by_type.items(), key=lambda item: min(map(_line_key, item[1]))
+        ):
+            for line in sorted(lines, key=_line_key):
+                conns.add(connection, line.edge[2])
+        origin.connections._changing()
+        origin.connections._conns = conns._conns
+
+    def _find_parent(self, name: str) -> Node:
+        if self._current is None:
+            return self.nodes.find_node(name)
+        # a full parse would only know the nodes of the lines before this one
+        if (nd := self.aliases.find(name, self._before(self._current))) is None:
+            raise SyntaxError("Nonexistant node")
+        return nd
 
-            if not len(alias):
-                alias = content
+    def _before(self, line: _Line) -> Callable[[Node], bool]:
+        """Whether a node was defined by a line before line"""
+        made_by = self._made_by
 
-            new = Node(alias, alias, content)
-            nd = self.nodes.get(left)
-            nd.children.add(new)
-            return
+        def defined_before(node: Node) -> bool:
+            # nodes of removed lines have no line until a new line defines them again
+            by = made_by.get(id(node))
+            return by is not None and by.key < line.key
 
-        # logical connection
-        if idx0 < idx1:
-            left = line[:idx0].strip(" ")
-            connection = line[idx0 + 1 : idx1].strip(" ")
-            right = line[idx1 + 1 :].strip(" ")
-
-            origin = self.nodes.find_node(left)
-            dests = []  # TODO: no append
-            for txt in right.split("&"):
-                txt.strip(" ")
-                try:
-                    nd = self.nodes.find_node(txt)
-                except:
-                    nd = Node(txt, txt, txt)
-                dests.append(nd)
-
-            origin.connections.add(connection, dests)
-            return
+        return defined_before
 
-        raise nodelang_exception(SyntaxError)(
-            f"{format_str('Invalid syntax', LIGHTRED, bold=True)}\n{self.format_debug_info(debug_info)}"
-        )
+    def _node_key(self, node: Node) -> int:
+        line = self._made_by.get(id(node))
+        return line.key if line is not None else 0
 
     def dump(self) -> Node_manager:
-        """A deepcopied instance of the node manager"""
-        return deepcopy(self.nodes)
+        """
+        A read-only snapshot of the nodes, taken in O(1).
+        Later changes to the graph copy what they change the first time, so the
+        snapshot keeps showing the graph as it is now, see _Versioned.
+        """
+        return Node_manager_snapshot(self.nodes, _Epoch())
+
+    @property
+    def query(self) -> Causal_query:
+        """Reverse edges, reachability and causal chains, see Causal_query"""
+        if self._query is None:
+            from causal_query import Causal_query
+
+            self._query = Causal_query(self)
+        return self._query
+
+    def complete(
+        self, prefix: str, k: int = 10, fuzzy: bool = False, names: bool = False
+    ) -> list[tuple[str, Node]]:
+        """Completions for a node reference being typed, see Alias_index.complete"""
+        return self.aliases.complete(prefix, k, fuzzy, names)
+
+    # === Instrumentation ===
+
+    @property
+    def stats(self) -> Parse_stats | None:
+        """The counters of instrument(), None when the graph isn't instrumented"""
+        return self._stats
+
+    def instrument(self, tracer: Tracer | None = None) -> Parse_stats:
+        """
+        Count and time what parsing does from now on, see Parse_stats.
+        tracer is called with the kind, token and seconds of every line parsed;
+        connection lines are counted when they are linked.
+        Only instrumented graphs pay for this: the counting versions of the methods
+        involved are put on the instances, the classes are left alone.
+        """
+        self._stats = Parse_stats()
+        self._tracer = tracer
+        self._hook()
+        return self._stats
+
+    def uninstrument(self) -> Parse_stats | None:
+        """Stop counting, returns what was counted"""
+        for owner, name in (
+            (self, "_apply"),
+            (self, "_connect"),
+            (self.aliases, "find"),
+            (self.symbols, "intern"),
+        ):
+            owner.__dict__.pop(name, None)
+        stats, self._stats, self._tracer = self._stats, None, None
+        return stats
+
+    def _hook(self):
+        """Shadow the methods parsing goes through with counting versions"""
+        stats, tracer = cast(Parse_stats, self._stats), self._tracer
+        apply, connect = type(self)._apply, type(self)._connect
+        index, symbols = self.aliases, self.symbols
+        find, intern = type(index).find, type(symbols).intern
+        clock = time.perf_counter
+
+        def timed_apply(token: Token, source=None, file=None):
+            if token.kind is Token_kind.CONNECT:
+                # only deferred, counted by timed_connect
+                return apply(self, token, source, file)
+            kind = _LINE_KINDS[token.kind]
+            start = clock()
+            try:
+                apply(self, token, source, file)
+            finally:
+                took = clock() - start
+                stats._count(kind, took)
+                if tracer is not None:
+                    tracer(kind, token, took)
+
+        def timed_connect(token: Token):
+            start = clock()
+            try:
+                return connect(self, token)
+            finally:
+                took = clock() - start
+                stats._count("connection", took)
+                if tracer is not None:
+                    tracer("connection", token, took)
+
+        def counted_find(name: str, accept: Callable[[Node], bool] | None = None):
+            stats.find_node_calls += 1
+            if accept is None:
+                node = find(index, name)
+                stats.visited_nodes += node is not None
+                return node
+
+            def counted_accept(node: Node) -> bool:
+                stats.visited_nodes += 1
+                return accept(node)
+
+            return find(index, name, counted_accept)
+
+        def counted_intern(name: str) -> Node:
+            stats.placeholders += name not in symbols._placeholders
+            return intern(symbols, name)
+
+        self._apply = timed_apply  # type: ignore[method-assign]
+        self._connect = timed_connect  # type: ignore[method-assign]
+        index.find = counted_find  # type: ignore[method-assign]
+        symbols.intern = counted_intern  # type: ignore[method-assign]
+
+    def compact(self) -> Compact_graph:
+        """A frozen, memory-light copy of the graph, see Compact_graph"""
+        from compiled import Compact_graph
+
+        return Compact_graph.from_graph(self)
+
+    def to_sparse(self):
+        """
+        SciPy sparse adjacency matrices of the graph and the analytics built on
+        them, see analytics.Sparse_graph. Needs numpy and scipy.
+        """
+        from analytics import Sparse_graph
+
+        return Sparse_graph.from_graph(self)
+
+    def save_compiled(self, path: str):
+        """Save the parsed graph so load_compiled can skip parsing it again"""
+        self.compact().save(path)
+
+    @staticmethod
+    def load_compiled(path: str) -> Compact_graph:
+        """
+        Open a graph saved with save_compiled. The file is mapped rather than read,
+        call to_graph() on the result for a Graph that can be changed.
+        """
+        from compiled import Compact_graph
+
+        return Compact_graph.load(path)
+
+    # === Export ===
+
+    def export_lines(self, format: str = "jsonl", color: bool = False) -> Iterator[str]:
+        """
+        The graph in one of EXPORT_FORMATS, a piece at a time: nodes by dotted path,
+        child relations and typed connections, placeholders last.
+        color only applies to "text", the view health_check prints.
+        """
+        from exporters import export_lines
+
+        return export_lines(self, format, color)
+
+    def export(
+        self,
+        out: Any,
+        format: str = "jsonl",
+        color: bool = False,
+        buffer_size: int = 1 << 16,
+    ) -> int:
+        """
+        Write export_lines to a text or binary file-like object, buffer_size
+        characters at a time. Returns the number of characters written.
+        """
+        binary = isinstance(out, io.IOBase) and not isinstance(out, io.TextIOBase)
+        written = size = 0
+        buffer: list[str] = []
+        for line in self.export_lines(format, color):
+            buffer.append(line)
+            size += len(line)
+            if size >= buffer_size:
+                chunk = "".join(buffer)
+                out.write(chunk.encode() if binary else chunk)
+                written += size
+                buffer.clear()
+                size = 0
+        chunk = "".join(buffer)
+        out.write(chunk.encode() if binary else chunk)
+        return written + size
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Hold off the cyclic garbage collector while building lots of objects that all
+    stay alive, it would otherwise walk them again and again for nothing
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _hashed(lines: Iterable[bytes], digest: hashlib._Hash) -> Iterator[bytes]:
+    """lines, added to digest as they go by"""
+    for line in lines:
+        digest.update(line)
+        yield line
+
+
+# moved to modules of their own, which build on this one; still importable from
+# here, imported when first asked for
+_MOVED = {
+    "EXPORT_FORMATS": "exporters",
+    "Chain_step": "causal_query",
+    "Causal_query": "causal_query",
+    "COMPILED_VERSION": "compiled",
+    "Compact_graph": "compiled",
+    "PARSER_VERSION": "parse_cache",
+    "Parse_cache": "parse_cache",
+    "Duplicate_definition": "project",
+    "Project": "project",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if (module := _MOVED.get(name)) is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module), name)
 
 
 # === Test Suite ===
@@ -296,11 +2027,14 @@ def print_result(test_name, passed, details=""):
 
 def health_check():
     """Health test"""
+    from parse_cache import Parse_cache
+    from project import Duplicate_definition, Project
+
     print_section("NODELANG SYNTAX TEST SUITE")
     print("Testing basic syntax features from syntax.md")
 
     tests_passed = 0
-    total_tests = 6
+    total_tests = 22
 
     # === TEST 1: Basic Definition ===
     print_section("Test 1: Node Definition")
@@ -370,7 +2104,6 @@ def health_check():
         parser4.parse(code4)
         origin = parser4.nodes.get("protref")
         assert "influenced" in origin.connections._conns
-        # Note: Whitespace bug may affect count
         dest_count = len(origin.connections._conns["influenced"])
         print_result("Multiple connections", True, f"Found {dest_count} destination(s)")
         tests_passed += 1
@@ -416,20 +2149,483 @@ def health_check():
     except Exception as e:
         print_result("Elaboration without alias", False, str(e))
 
+    # === TEST 7: Streaming with forward references ===
+    print_section("Test 7: Streamed lines with a forward reference")
+    code7 = """
+    protref <caused> reldiv
+    protestant reformation (protref) : some event in Europe
+    religious diversity (reldiv) : increase in different religions
+    """
+    print(f"Input:{code7}")
+
+    parser7 = Graph()
+    try:
+        parser7.parse_stream(code7.splitlines(keepends=True))
+        origin = parser7.nodes.get("protref")
+        assert origin.connections._conns["caused"][0] is parser7.nodes.get("reldiv")
+        print_result("Forward reference", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Forward reference", False, str(e))
+
+    # === TEST 8: Incremental edits ===
+    print_section("Test 8: Incremental edit matches a full parse")
+    code8 = """protestant reformation (protref) : some event in Europe
+protref < (prots) there were protestants involved in this
+protref <caused> reldiv
+religious diversity (reldiv) : increase in different religions
+"""
+    edit8 = "protestant reformation (protref) : religious movement\n"
+    print(f"Input:\n{code8}Line 1 becomes: {edit8}")
+
+    parser8 = Graph()
+    try:
+        parser8.parse(code8, incremental=True)
+        origin = parser8.nodes.get("protref")
+        parser8.apply_edit(0, 1, edit8)
+        full8 = Graph()
+        full8.parse(edit8 + code8.split("\n", 1)[1])
+        assert parser8.nodes.get("protref") is origin
+        assert origin.content == full8.nodes.get("protref").content
+        assert origin.children.get("prots") is not None
+        assert origin.connections._conns["caused"][0] is parser8.nodes.get("reldiv")
+        print_result("Incremental edit", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Incremental edit", False, str(e))
+
+    # === TEST 9: Nested aliases ===
+    print_section("Test 9: Dotted paths and child aliases")
+    code9 = """
+    protestant reformation (protref) : some event in Europe
+    protref < (prots) there were protestants involved in this
+    protref.prots < (luth) the protestants were protestants
+    religious diversity (reldiv) : increase in different religions
+    prots <caused> reldiv
+    reldiv <influenced> protref.prots.luth
+    """
+    print(f"Input:{code9}")
+
+    parser9 = Graph()
+    try:
+        parser9.parse(code9)
+        prots = parser9.nodes.get("protref").children.get("prots")
+        luth = prots.children.get("luth")
+        assert parser9.nodes.find_node("luth") is luth
+        assert prots.connections._conns["caused"][0] is parser9.nodes.get("reldiv")
+        assert parser9.nodes.get("reldiv").connections._conns["influenced"][0] is luth
+        print_result("Nested aliases", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Nested aliases", False, str(e))
+
+    # === TEST 10: Undefined targets ===
+    print_section("Test 10: Undefined connection targets")
+    code10 = """
+    protestant reformation (protref) : some event in Europe
+    protref <caused> secularism & individualism
+    protref <influenced> secularism
+    """
+    print(f"Input:{code10}")
+
+    parser10 = Graph()
+    try:
+        parser10.parse(code10)
+        conns = parser10.nodes.get("protref").connections._conns
+        assert conns["caused"][0] is conns["influenced"][0]
+        assert [ref.name for ref in parser10.unresolved()] == [
+            "secularism",
+            "individualism",
+            "secularism",
+        ]
+        # the targets of an edited line are listed in the order they are written
+        edited10 = Graph()
+        edited10.parse(code10, incremental=True)
+        edited10.apply_edit(2, 3, "protref <caused> individualism & secularism\n")
+        assert [ref.name for ref in edited10.unresolved()] == [
+            "individualism",
+            "secularism",
+            "secularism",
+        ]
+        print_result("Shared placeholders", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Shared placeholders", False, str(e))
+
+    # === TEST 11: Compact graph ===
+    print_section("Test 11: Compact graph matches the graph")
+    print(f"Input:{code9}")
+
+    try:
+        compact = parser9.compact()
+        luth = compact.find_node("luth")
+        assert compact.path_of(luth) == "protref.prots.luth"
+        reldiv = compact.get("reldiv")
+        assert list(compact.targets(reldiv, "influenced")) == [luth]
+        prots = compact.get("prots", compact.get("protref"))
+        assert compact.connections(prots) == {"caused": [reldiv]}
+        print_result("Compact graph", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Compact graph", False, str(e))
+
+    # === TEST 12: Snapshots ===
+    print_section("Test 12: Snapshots don't see later changes")
+    print(f"Input:{code2}")
+
+    try:
+        snapshot = parser2.dump()
+        parser2.parse("protref < (catholics) so were catholics")
+        protref = snapshot.get("protref")
+        assert [child.id for child in protref.children.get_all()] == ["prots"]
+        assert len(parser2.nodes.get("protref").children.get_all()) == 2
+        # fields written directly are kept from the snapshot too
+        content = protref.content
+        parser2.nodes.get("protref").content = "rewritten"
+        assert snapshot.find_node("protref").content == content
+        assert snapshot.lookup("catholics") is None
+        assert snapshot.find_node("prots").content.startswith("there were")
+        print_result("Snapshot", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Snapshot", False, str(e))
+
+    # === TEST 13: Compiled graphs ===
+    print_section("Test 13: Compiled graph round trip")
+    print(f"Input:{code9}")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graph.nlc")
+            parser9.save_compiled(path)
+            loaded = Graph.load_compiled(path)
+            luth = loaded.find_node("luth")
+            assert loaded.content(luth) == "the protestants were protestants"
+            thawed = loaded.to_graph()
+            reldiv = thawed.nodes.get("reldiv")
+            assert reldiv.connections._conns["influenced"][0].id == "luth"
+            del loaded
+        print_result("Compiled graph", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Compiled graph", False, str(e))
+
+    # === TEST 14: Parse cache ===
+    print_section("Test 14: Parse cache")
+    print(f"Input:{code10}")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history.causality")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(code10)
+            cache = Parse_cache(os.path.join(tmp, "cache"))
+            for _ in range(2):
+                cached = Graph()
+                cached.parse_file(path, cache=cache)
+            assert (cache.hits, cache.misses) == (1, 1)
+            conns = cached.nodes.get("protref").connections._conns
+            assert conns["caused"][0] is conns["influenced"][0]
+            assert cached.unresolved() == [
+                ref._replace(file=path) for ref in parser10.unresolved()
+            ]
+            del cached, conns
+        print_result("Parse cache", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Parse cache", False, str(e))
+
+    # === TEST 15: Projects ===
+    print_section("Test 15: Project of several files")
+    files15 = [
+        "protestant reformation (protref) : some event in Europe\n"
+        "protref <caused> reldiv",
+        "religious diversity (reldiv) : increase in different religions\n"
+        "protref < (prots) there were protestants involved in this",
+        "religious diversity (reldiv) : defined again",
+    ]
+    print("Input:\n" + "\n---\n".join(files15))
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for idx, text in enumerate(files15):
+                paths.append(os.path.join(tmp, f"{idx}.causality"))
+                with open(paths[-1], "w", encoding="utf-8") as f:
+                    f.write(text)
+            project = Project(paths, workers=2)
+            graph15 = project.load()
+        protref = graph15.nodes.get("protref")
+        assert protref.connections._conns["caused"][0] is graph15.nodes.get("reldiv")
+        assert protref.children.get("prots") is not None
+        assert project.duplicates == [
+            Duplicate_definition("reldiv", paths[2], 1, paths[1], 1)
+        ]
+        print_result("Project", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Project", False, str(e))
+
+    # === TEST 16: Causal queries ===
+    print_section("Test 16: Causal queries")
+    code16 = """
+    protestant reformation (protref) : some event in Europe
+    religious diversity (reldiv) : increase in different religions
+    secularism (secular) : separation of church and state
+    protref <caused> reldiv
+    reldiv <caused> secular
+    protref <influenced> secular
+    """
+    print(f"Input:{code16}")
+
+    parser16 = Graph()
+    try:
+        parser16.parse(code16)
+        query = parser16.query
+        protref = parser16.nodes.get("protref")
+        reldiv = parser16.nodes.get("reldiv")
+        secular = parser16.nodes.get("secular")
+        assert query.incoming(secular, ["caused"]) == [reldiv]
+        assert query.reaches(protref, secular, ["caused"])
+        assert not query.reaches(secular, protref)
+        chain = query.shortest_chain("protref", "secular", ["caused"])
+        assert chain == [(protref, "caused", reldiv), (reldiv, "caused", secular)]
+        assert len(list(query.all_chains(protref, secular))) == 2
+        parser16.parse("secular <caused> protref")
+        assert query.reaches(secular, protref)
+        # changing the nodes directly doesn't go through the graph, but still counts
+        assert query.incoming(reldiv) == [protref]
+        secular.connections.add("caused", [reldiv])
+        assert query.incoming(reldiv) == [protref, secular]
+        print_result("Causal queries", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Causal queries", False, str(e))
+
+    print_section("Test 17: Parser instrumentation")
+    code17 = """
+    # reformation
+    protestant reformation (protref) : some event in Europe
+    protref < (prots) protestants
+    protref <caused> reldiv & prots
+    """
+    print(f"Input:{code17}")
+
+    parser17 = Graph()
+    try:
+        traced: list[str] = []
+        stats = parser17.instrument(lambda kind, token, took: traced.append(kind))
+        parser17.parse(code17)
+        lines = {"annotation": 1, "definition": 1, "elaboration": 1, "connection": 1}
+        assert stats.lines == lines
+        assert sorted(traced) == sorted(lines)
+        assert stats.placeholders == 1 and stats.find_node_calls >= 4
+        before = stats.snapshot()
+        assert parser17.uninstrument() is stats
+        parser17.parse("religious diversity (reldiv) : more religions")
+        assert stats == before and json.loads(stats.to_json())["placeholders"] == 1
+        print_result("Parser instrumentation", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Parser instrumentation", False, str(e))
+
+    print_section("Test 18: Error-recovering parse")
+    code18 = """
+    protestant reformation (protref) : some event in Europe
+    this line is not nodelang
+    nothing < (prots) protestants
+    protref <caused> reldiv
+    ghost <caused> protref
+    """
+    print(f"Input:{code18}")
+
+    parser18 = Graph()
+    try:
+        found = parser18.parse(code18, recover=True)
+        assert found is not None
+        assert [(str(d.severity.value), d.span.line) for d in found] == [
+            ("error", 3),
+            ("error", 4),
+            ("error", 6),
+        ]
+        assert parser18.nodes.get("protref").connections._conns["caused"]
+        assert len(Graph().parse(code18, recover=True, max_errors=1) or ()) == 1
+        print(found[0].format())
+        print_result("Error-recovering parse", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Error-recovering parse", False, str(e))
+
+    print_section("Test 19: Streaming exporters")
+    code19 = """
+    protestant reformation (protref) : some event in Europe
+    protref < (prots) protestants
+    protref <caused> reldiv & prots
+    """
+    print(f"Input:{code19}")
+
+    parser19 = Graph()
+    try:
+        parser19.parse(code19)
+        out = io.StringIO()
+        written = parser19.export(out, "jsonl", buffer_size=16)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert written == len(out.getvalue()) and len(records) == 6
+        assert {"type": "child", "parent": "protref", "child": "protref.prots"} in records
+        assert records[-1] == {"type": "node", "id": "reldiv", "placeholder": True}
+        dot = "".join(parser19.export_lines("dot"))
+        assert '"protref" -> "reldiv" [label="caused"];' in dot
+        binary = io.BytesIO()
+        parser19.export(binary, "graphml")
+        assert binary.getvalue().rstrip().endswith(b"</graphml>")
+        assert "\033" not in "".join(parser19.export_lines("text"))
+        print_result("Streaming exporters", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Streaming exporters", False, str(e))
+
+    print_section("Test 20: Alias completion")
+    code20 = """
+    protestant reformation (protref) : some event in Europe
+    protref < (prots) protestants
+    protref < (princes) german princes
+    printing press (press) : movable type
+    """
+    print(f"Input:{code20}")
+
+    parser20 = Graph()
+    try:
+        parser20.parse(code20)
+        keys = [key for key, _ in parser20.complete("pr", k=4)]
+        assert keys == ["press", "princes", "protref", "protref.princes"]
+        assert [key for key, _ in parser20.complete("protref.", k=1)] == [
+            "protref.princes"
+        ]
+        assert parser20.complete("prots")[0][1] is parser20.nodes.find_node("prots")
+        assert [key for key, _ in parser20.complete("portref", fuzzy=True)] == [
+            "protref",
+            "protref.princes",
+            "protref.prots",
+        ]
+        assert [name for name, _ in parser20.complete("PRINT", names=True)] == [
+            "printing press"
+        ]
+        parser20.nodes.get("press").redefine("printing", "movable type")
+        parser20.nodes.remove("protref")
+        assert [key for key, _ in parser20.complete("pr")] == ["press"]
+        assert [name for name, _ in parser20.complete("p", names=True)] == [
+            "printing"
+        ]
+        print_result("Alias completion", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Alias completion", False, str(e))
+
+    print_section("Test 21: Continuation lines")
+    code21 = """
+    protestant reformation (protref) : some event in Europe
+    < (prots) there were protestants involved in this
+    << (luth) lutherans
+    < (princes) german princes
+    prots <caused> reldiv
+    """
+    print(f"Input:{code21}")
+
+    parser21 = Graph()
+    try:
+        parser21.parse(code21)
+        protref = parser21.nodes.get("protref")
+        assert protref.children.get("princes") is not None
+        assert parser21.nodes.lookup("protref.prots.luth").content == "lutherans"
+        assert parser21.nodes.lookup("prots").connections._conns["caused"]
+        found = Graph().parse("< orphan\na (a) : b\n<< (c) too deep\n", recover=True)
+        assert [d.span.line for d in found or ()] == [1, 3]
+        assert "Nesting too deep" in found[1].message
+        # the context counts blank lines too, like the line number above it
+        found = Graph().parse("a (a) : b\n\n<< (c) x\n", recover=True)
+        assert found[0].span.line == 3
+        assert "\n|2| \n|3| << (c) x" in found[0].format(color=False)
+        deep = "root (root) : r\n" + "".join(
+            f"{'<' * depth} (n{depth}) n\n" for depth in range(1, 2001)
+        )
+        parser = Graph()
+        parser.parse(deep)
+        assert parser.nodes.lookup("n2000").content == "n"
+        # re-nesting a line moves the lines continuing it along with it
+        edited = Graph()
+        edited.parse(code21, incremental=True)
+        edited.apply_edit(3, 4, "< (luth) lutherans\n")
+        assert edited.nodes.lookup("protref.luth") is not None
+        assert edited.nodes.lookup("protref.prots.luth") is None
+        assert edited.nodes.lookup("protref.princes") is not None
+        # a continuation typed above another of the same alias, which moves on
+        moved = Graph()
+        moved.parse("N (a3) : c2\nN (a2) : c2\n< (b1) x2\n", incremental=True)
+        moved.apply_edit(2, 2, "< (b1) x0\nN (a1) : c1\n")
+        assert moved.nodes.lookup("a2.b1").content == "x0"
+        assert moved.nodes.lookup("a1.b1").content == "x2"
+        # an edit that doesn't parse raises, and leaves the document as it was
+        texts = [line.text for line in edited._lines]
+        try:
+            edited.apply_edit(1, 2, "")
+        except SyntaxError as e:
+            assert "Nothing to continue" in str(e)
+        else:
+            raise AssertionError("removing the definition should fail")
+        assert [line.text for line in edited._lines] == texts
+        assert edited.nodes.lookup("protref.luth") is not None
+        print_result("Continuation lines", True)
+        tests_passed += 1
+    except Exception as e:
+        print_result("Continuation lines", False, str(e))
+
+    # === TEST 22: Installed modules ===
+    print_section("Test 22: Installed modules")
+
+    # run from the built modules only, with numpy and scipy if they are installed
+    installed = """
+import sys
+from importlib.util import find_spec
+import causality_lang
+assert causality_lang.__file__.startswith(sys.argv[1])
+for module in ("analytics", "causal_query", "compiled", "exporters", "project"):
+    assert find_spec(module).origin.startswith(sys.argv[1])
+assert causality_lang.Parse_cache.__module__ == "parse_cache"
+if find_spec("numpy") and find_spec("scipy"):
+    graph = causality_lang.Graph()
+    graph.parse("a (a) : x\\nb (b) : y\\na <caused> b\\n")
+    assert graph.to_sparse().out_degree().tolist() == [1, 0]
+"""
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            lib = os.path.join(tmp, "lib")
+            build = ["build", "--build-base", os.path.join(tmp, "build")]
+            subprocess.run(
+                [sys.executable, "setup.py", "-q", *build, "--build-lib", lib],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                check=True,
+                capture_output=True,
+            )
+            env = {**os.environ, "PYTHONPATH": lib}
+            subprocess.run(
+                [sys.executable, "-c", installed, lib],
+                cwd=tmp,
+                env=env,
+                check=True,
+                capture_output=True,
+            )
+        print_result("Installed modules", True)
+        tests_passed += 1
+    except Exception as e:
+        stderr = getattr(e, "stderr", None)
+        print_result("Installed modules", False, stderr.decode() if stderr else str(e))
+
     # === SUMMARY ===
     print_section("TEST SUMMARY")
     summary = f"Tests Passed: {tests_passed}/{total_tests}"
     color = GREEN if tests_passed == total_tests else RED
     print(format_str(summary, color, bold=True))
 
-    if tests_passed < total_tests:
-        print(format_str("\nKnown Limitations:", YELLOW))
-        print("  • Definition without parentheses 'name : content' has parsing issues")
-        print(
-            "  • Multiple connections may not split correctly on '&' due to whitespace"
-        )
-        print("  • find_node() BFS may not work as expected for nested lookups")
-
     # === GRAPH VISUALIZATION ===
     print_section("GRAPH VISUALIZATION")
     print("Final parsed graph structure:")
@@ -445,23 +2641,14 @@ def health_check():
     final_parser = Graph()
     try:
         final_parser.parse(full_code)
-        for node in final_parser.nodes.get_all():
-            print(f"\n{format_str(node.name, LIGHTGREEN)} ({node.id}):")
-            print(f"  Content: {node.content}")
-
-            if node.children.get_all():
-                print(f"  {format_str('Children:', LIGHTBLUE)}")
-                for child in node.children.get_all():
-                    print(f"    • {child.name}: {child.content}")
-
-            if node.connections._conns:
-                print(f"  {format_str('Connections:', LIGHTBLUE)}")
-                for conn_type, dests in node.connections._conns.items():
-                    for dest in dests:
-                        print(f"    • {conn_type} → {dest.name} ({dest.id})")
+        final_parser.export(sys.stdout, "text", color=True)
     except Exception as e:
         print(format_str(f"Visualization failed: {e}", RED))
 
 
 if __name__ == "__main__":
-    health_check()
+    # the modules split out of this one import it as causality_lang, so the tests
+    # run on that copy of it rather than on __main__
+    import causality_lang
+
+    causality_lang.health_check()
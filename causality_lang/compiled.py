@@ -0,0 +1,517 @@
+"""
+Compact_graph, a frozen copy of a Graph in flat arrays, and the compiled file
+format it is saved in, see Graph.save_compiled.
+"""
+
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from collections import deque
+from itertools import accumulate, repeat
+from typing import Any, Iterator, Sequence, cast
+import mmap
+import os
+import struct
+import sys
+
+from causality_lang import Graph, Node, _gc_paused
+
+
+# compiled graphs: a header, then the arrays of a Compact_graph one after the
+# other, each starting on a multiple of 8 bytes, integers little-endian
+COMPILED_VERSION = 1
+_COMPILED_MAGIC = b"NLGC"
+# magic, version, top-level nodes, tree nodes, nodes with placeholders, strings,
+# string bytes, connection types, ints in the connection order section
+_COMPILED_HEADER = struct.Struct("<4sI7Q")
+
+
+class Compact_graph:
+    """
+    A frozen, columnar copy of a Graph, for big graphs that are only read.
+    Nodes are ints numbered breadth first: the top-level nodes come first and the
+    children of a node are the consecutive ids children(node). Placeholders for
+    undefined connection targets come after the nodes of the tree.
+    Every string is interned into one utf-8 table and decoded when asked for,
+    connections are CSR arrays (offsets by origin, targets), one pair per type.
+    Lookups follow the same rules as Node_manager and Alias_index.
+    save() writes the arrays as they are, so load() maps them back without copying.
+    """
+
+    def __init__(
+        self,
+        strings: bytes | memoryview,
+        string_offsets: Sequence[int],
+        aliases: Sequence[int],
+        names: Sequence[int],
+        contents: Sequence[int],
+        parents: Sequence[int],
+        first_child: Sequence[int],
+        child_order: Sequence[int],
+        alias_order: Sequence[int],
+        edges: dict[str, tuple[Sequence[int], Sequence[int]]],
+        orders: dict[int, tuple[str, ...]],
+        root_count: int,
+    ) -> None:
+        self._strings = strings
+        self._string_offsets = string_offsets
+        # string table indices, by node
+        self._aliases = aliases
+        self._names = names
+        self._contents = contents
+        self._parents = parents  # -1 for top-level nodes and placeholders
+        # children of node i are first_child[i]:first_child[i + 1], one entry per
+        # node of the tree plus an end marker
+        self._first_child = first_child
+        # ids sorted by alias within every run of siblings, to bisect in get()
+        self._child_order = child_order
+        # nested ids sorted by alias, depth and path, to bisect in lookup()
+        self._alias_order = alias_order
+        self._edges = edges  # connection type -> (offsets, targets)
+        # connection types of the nodes that don't list them in the order of _edges
+        self._orders = orders
+        self._root_count = root_count
+        self._tree_size = len(first_child) - 1
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> Compact_graph:
+        return cls._from_graph(graph)[0]
+
+    @classmethod
+    def _from_graph(cls, graph: Graph) -> tuple[Compact_graph, list[Node]]:
+        """The compact graph, and the nodes of graph by their ids in it"""
+        table: dict[str, int] = {}
+
+        def intern(text: str) -> int:
+            if (idx := table.get(text)) is None:
+                idx = table[text] = len(table)
+            return idx
+
+        # breadth first, the list grows while it is walked
+        nodes = graph.nodes.get_all()
+        root_count = len(nodes)
+        parents = array("i", [-1]) * root_count
+        first_child = array("I")
+        paths = [node.id for node in nodes]
+        child_order = array("I", sorted(range(root_count), key=paths.__getitem__))
+        for idx, node in enumerate(nodes):
+            first = len(nodes)
+            first_child.append(first)
+            kids = node.children.get_all()
+            if not kids:
+                continue
+            nodes.extend(kids)
+            parents.extend(array("i", [idx]) * len(kids))
+            paths.extend(f"{paths[idx]}.{kid.id}" for kid in kids)
+            child_order.extend(
+                sorted(range(first, len(nodes)), key=lambda i: nodes[i].id)
+            )
+        first_child.append(len(nodes))
+        tree_size = len(nodes)
+
+        depths = array("I", [0]) * tree_size
+        for idx in range(root_count, tree_size):
+            depths[idx] = depths[parents[idx]] + 1
+        alias_order = array(
+            "I",
+            sorted(
+                range(root_count, tree_size),
+                key=lambda i: (nodes[i].id, depths[i], paths[i]),
+            ),
+        )
+
+        ids = {id(node): idx for idx, node in enumerate(nodes)}
+        edges: dict[str, tuple[array[int], array[int]]] = {}
+        ranks: dict[str, int] = {}
+        orders: dict[int, tuple[str, ...]] = {}
+        for idx in range(tree_size):
+            conns = nodes[idx].connections._conns
+            if len(conns) > 1:
+                types = tuple(conns)
+                known = [ranks.get(conn_type, len(ranks)) for conn_type in types]
+                if known != sorted(known):
+                    orders[idx] = types
+            for conn_type, dests in conns.items():
+                if (csr := edges.get(conn_type)) is None:
+                    csr = edges[conn_type] = (array("I"), array("I"))
+                    ranks[conn_type] = len(ranks)
+                offsets, targets = csr
+                offsets.extend(repeat(len(targets), idx + 1 - len(offsets)))
+                for dest in dests:
+                    if (dest_id := ids.get(id(dest))) is None:
+                        # a placeholder
+                        dest_id = ids[id(dest)] = len(nodes)
+                        nodes.append(dest)
+                        parents.append(-1)
+                    targets.append(dest_id)
+        for offsets, targets in edges.values():
+            offsets.extend(repeat(len(targets), tree_size + 1 - len(offsets)))
+
+        aliases = array("I", [intern(node.id) for node in nodes])
+        names = array("I", [intern(node.name) for node in nodes])
+        contents = array("I", [intern(node.content) for node in nodes])
+        encoded = [text.encode() for text in table]
+        compact = cls(
+            b"".join(encoded),
+            array("Q", accumulate(map(len, encoded), initial=0)),
+            aliases,
+            names,
+            contents,
+            parents,
+            first_child,
+            child_order,
+            alias_order,
+            edges,
+            orders,
+            root_count,
+        )
+        return compact, nodes
+
+    def _columns(self) -> list[tuple[str, Sequence[int]]]:
+        """(array type code, column) in the order they are saved"""
+        return [
+            ("Q", self._string_offsets),
+            ("I", self._aliases),
+            ("I", self._names),
+            ("I", self._contents),
+            ("i", self._parents),
+            ("I", self._first_child),
+            ("I", self._child_order),
+            ("I", self._alias_order),
+        ]
+
+    def save(self, path: str):
+        """
+        Write the graph in the compiled format, see load.
+        The file is replaced in one go, so graphs mapped from it stay valid.
+        """
+        types = list(self._edges)
+        ranks = {conn_type: rank for rank, conn_type in enumerate(types)}
+        type_names = [conn_type.encode() for conn_type in types]
+        order_section = array("I")
+        for node, node_types in self._orders.items():
+            order_section.extend((node, len(node_types)))
+            order_section.extend(ranks[conn_type] for conn_type in node_types)
+
+        columns = self._columns()
+        columns.append(("Q", array("Q", accumulate(map(len, type_names), initial=0))))
+        columns.append(("B", b"".join(type_names)))
+        for offsets, targets in self._edges.values():
+            columns.append(("I", offsets))
+            columns.append(("I", targets))
+        columns.append(("I", order_section))
+
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(
+                _COMPILED_HEADER.pack(
+                    _COMPILED_MAGIC,
+                    COMPILED_VERSION,
+                    self._root_count,
+                    self._tree_size,
+                    len(self._aliases),
+                    len(self._string_offsets) - 1,
+                    len(self._strings),
+                    len(types),
+                    len(order_section),
+                )
+            )
+            f.write(self._strings)
+            for code, column in columns:
+                f.write(bytes(-f.tell() % 8))
+                if sys.byteorder == "big":
+                    column = array(code, column)
+                    column.byteswap()
+                f.write(cast(Any, column))
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Compact_graph:
+        """
+        Map a compiled graph from save() into memory. Nothing is copied or decoded
+        up front, the arrays are views of the file (except on big-endian machines).
+        """
+        with open(path, "rb") as f:
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        if len(buffer) < _COMPILED_HEADER.size:
+            raise ValueError(f"{path} isn't a compiled nodelang graph")
+        (
+            magic,
+            version,
+            root_count,
+            tree_size,
+            node_count,
+            string_count,
+            string_bytes,
+            type_count,
+            order_count,
+        ) = _COMPILED_HEADER.unpack_from(buffer)
+        if magic != _COMPILED_MAGIC:
+            raise ValueError(f"{path} isn't a compiled nodelang graph")
+        if version != COMPILED_VERSION:
+            raise ValueError(
+                f"{path} is compiled graph version {version}, "
+                f"expected {COMPILED_VERSION}"
+            )
+
+        pos = _COMPILED_HEADER.size
+        strings = buffer[pos : pos + string_bytes]
+        pos += string_bytes
+
+        def take(code: str, count: int) -> Sequence[int]:
+            nonlocal pos
+            pos += -pos % 8
+            size = count * array(code).itemsize
+            if pos + size > len(buffer):
+                raise ValueError(f"{path} is truncated")
+            view = buffer[pos : pos + size]
+            pos += size
+            if sys.byteorder == "big":
+                column = array(code, view.tobytes())
+                column.byteswap()
+                return column
+            return view.cast(code)
+
+        string_offsets = take("Q", string_count + 1)
+        aliases = take("I", node_count)
+        names = take("I", node_count)
+        contents = take("I", node_count)
+        parents = take("i", node_count)
+        first_child = take("I", tree_size + 1)
+        child_order = take("I", tree_size)
+        alias_order = take("I", tree_size - root_count)
+        type_offsets = take("Q", type_count + 1)
+        type_names = take("B", type_offsets[-1])
+        types = [
+            str(type_names[type_offsets[idx] : type_offsets[idx + 1]], "utf-8")
+            for idx in range(type_count)
+        ]
+        edges = {}
+        for conn_type in types:
+            offsets = take("I", tree_size + 1)
+            edges[conn_type] = (offsets, take("I", offsets[-1]))
+        order_section = take("I", order_count)
+        orders = {}
+        idx = 0
+        while idx < order_count:
+            node, count = order_section[idx], order_section[idx + 1]
+            orders[node] = tuple(
+                types[rank] for rank in order_section[idx + 2 : idx + 2 + count]
+            )
+            idx += 2 + count
+        return cls(
+            strings,
+            string_offsets,
+            aliases,
+            names,
+            contents,
+            parents,
+            first_child,
+            child_order,
+            alias_order,
+            edges,
+            orders,
+            root_count,
+        )
+
+    def _string(self, idx: int) -> str:
+        offsets = self._string_offsets
+        return str(self._strings[offsets[idx] : offsets[idx + 1]], "utf-8")
+
+    def __len__(self) -> int:
+        """Nodes in the tree, not counting placeholders"""
+        return self._tree_size
+
+    def __iter__(self) -> Iterator[int]:
+        """Every node of the tree, breadth first"""
+        return iter(range(self._tree_size))
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the arrays and string table"""
+        columns = [column for _, column in self._columns()]
+        columns.extend(column for csr in self._edges.values() for column in csr)
+        return len(self._strings) + sum(
+            len(column) * memoryview(column).itemsize for column in columns
+        )
+
+    # node attributes
+    def alias(self, node: int) -> str:
+        """The id of the node, what it is called in its Node_manager"""
+        return self._string(self._aliases[node])
+
+    def name(self, node: int) -> str:
+        return self._string(self._names[node])
+
+    def content(self, node: int) -> str:
+        return self._string(self._contents[node])
+
+    def is_placeholder(self, node: int) -> bool:
+        return node >= self._tree_size
+
+    def parent(self, node: int) -> int | None:
+        parent = self._parents[node]
+        return parent if parent != -1 else None
+
+    def path_of(self, node: int) -> str:
+        """Dotted path of the node, like Node_manager.path_of"""
+        parts = [self.alias(node)]
+        while (node := self._parents[node]) != -1:
+            parts.append(self.alias(node))
+        return ".".join(reversed(parts))
+
+    # Node_manager
+    def _siblings(self, parent: int | None) -> tuple[int, int]:
+        if parent is None:
+            return 0, self._root_count
+        if parent >= self._tree_size:
+            return 0, 0
+        return self._first_child[parent], self._first_child[parent + 1]
+
+    def get_all(self, parent: int | None = None) -> range:
+        """The children of parent, or the top-level nodes"""
+        return range(*self._siblings(parent))
+
+    children = get_all
+
+    def get(self, id: str, parent: int | None = None) -> int:
+        """The child of parent (or top-level node) with the alias id"""
+        if (node := self._child(id, parent)) is None:
+            raise SyntaxError("Nonexistant node")
+        return node
+
+    def _child(self, id: str, parent: int | None) -> int | None:
+        lo, hi = self._siblings(parent)
+        order = self._child_order
+        pos = bisect_left(order, id, lo, hi, key=self.alias)
+        if pos < hi and self.alias(order[pos]) == id:
+            return order[pos]
+        return None
+
+    def find_node(self, id: str) -> int:
+        """Node with the dotted path or alias id, see Node_manager.find_node"""
+        if (node := self.lookup(id)) is None:
+            raise SyntaxError("Nonexistant node")
+        return node
+
+    def lookup(self, id: str) -> int | None:
+        """find_node, but None when there is no such node"""
+        if (found := self._find_path(id, None, 0)) is not None:
+            return found[1]
+        order = self._alias_order
+        pos = bisect_left(order, id, key=self.alias)
+        if pos < len(order) and self.alias(order[pos]) == id:
+            return order[pos]
+        return None
+
+    def _find_path(
+        self, path: str, parent: int | None, depth: int
+    ) -> tuple[int, int] | None:
+        """Shallowest (depth, node) at path under parent, aliases may hold dots"""
+        best = None
+        if (node := self._child(path, parent)) is not None:
+            best = (depth, node)
+        dot = path.find(".")
+        while dot != -1:
+            if (node := self._child(path[:dot], parent)) is not None:
+                found = self._find_path(path[dot + 1 :], node, depth + 1)
+                if found is not None and (best is None or found < best):
+                    best = found
+            dot = path.find(".", dot + 1)
+        return best
+
+    def descendants(self, node: int | None = None) -> Iterator[int]:
+        """Everything under node (or the whole tree), breadth first"""
+        frontier = deque([self.get_all(node)])
+        while frontier:
+            for child in frontier.popleft():
+                yield child
+                frontier.append(self.get_all(child))
+
+    # Connection_manager
+    @property
+    def connection_types(self) -> list[str]:
+        return list(self._edges)
+
+    def targets(self, node: int, conn_type: str) -> Sequence[int]:
+        """Where node's connections of conn_type lead"""
+        if (csr := self._edges.get(conn_type)) is None or node >= self._tree_size:
+            return ()
+        offsets, targets = csr
+        return targets[offsets[node] : offsets[node + 1]]
+
+    def connections(self, node: int) -> dict[str, list[int]]:
+        """The connections of node, like Connection_manager._conns"""
+        conns: dict[str, list[int]] = {}
+        if node >= self._tree_size:
+            return conns
+        for conn_type in self._orders.get(node, self._edges):
+            offsets, targets = self._edges[conn_type]
+            start, end = offsets[node], offsets[node + 1]
+            if start != end:
+                conns[conn_type] = list(targets[start:end])
+        return conns
+
+    def edges(self, conn_type: str) -> tuple[Sequence[int], Sequence[int]]:
+        """The CSR arrays of conn_type: targets[offsets[i]:offsets[i + 1]] per node"""
+        if (csr := self._edges.get(conn_type)) is None:
+            raise KeyError(conn_type)
+        return csr
+
+    def to_graph(self) -> Graph:
+        """
+        Thaw into a Graph. Placeholders are interned again, their references have
+        the path of the origin and no line (0) since the source isn't known.
+        """
+        with _gc_paused():
+            return self._thaw()
+
+    def _thaw_tree(self, aliases: list[str], strings: list[str]) -> list[Node]:
+        """Nodes of the tree by id, children added but not indexed"""
+        names, contents, parents = self._names, self._contents, self._parents
+        nodes: list[Node] = []
+        for idx in range(self._tree_size):
+            node = Node(aliases[idx], strings[names[idx]], strings[contents[idx]])
+            if idx >= self._root_count:
+                # the ids are unique in every manager, so add() can be skipped
+                nodes[parents[idx]].children._nodes[node.id] = node
+            nodes.append(node)
+        return nodes
+
+    def _thaw(self) -> Graph:
+        strings = self._decode_all()
+        aliases = [strings[idx] for idx in self._aliases]
+        tree_size = self._tree_size
+        graph = Graph()
+        symbols = graph.symbols
+        nodes = self._thaw_tree(aliases, strings)
+        graph.nodes._nodes = {node.id: node for node in nodes[: self._root_count]}
+        graph.aliases.attach(graph.nodes)
+        for idx in range(tree_size, len(aliases)):
+            nodes.append(symbols.intern(aliases[idx]))
+
+        for conn_type, (offsets, targets) in self._edges.items():
+            for idx in range(tree_size):
+                start, end = offsets[idx], offsets[idx + 1]
+                if start == end:
+                    continue
+                conns = nodes[idx].connections._conns
+                dests = conns[conn_type] = [nodes[dest] for dest in targets[start:end]]
+                for pos in range(end - start):
+                    if (dest := targets[start + pos]) >= tree_size:
+                        ref = (self.path_of(idx), conn_type, 0, None, 0)
+                        slot = (nodes[idx].connections, dests, pos)
+                        symbols.refer(aliases[dest], ref, slot)
+        for idx, types in self._orders.items():
+            conns = nodes[idx].connections
+            conns._conns = {conn_type: conns._conns[conn_type] for conn_type in types}
+        return graph
+
+    def _decode_all(self) -> list[str]:
+        """The whole string table"""
+        offsets = self._string_offsets
+        text = str(self._strings, "utf-8")
+        if len(text) == len(self._strings):
+            # ascii, the byte offsets are character offsets
+            return [text[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)]
+        return [self._string(i) for i in range(len(offsets) - 1)]
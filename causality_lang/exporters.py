@@ -0,0 +1,181 @@
+"""
+The exporters of Graph.export_lines: JSON lines, Graphviz dot, GraphML and the
+text view health_check prints, each a piece at a time.
+"""
+
+from __future__ import annotations
+from collections import deque
+from json.encoder import encode_basestring
+from typing import Any, Callable, Iterable, Iterator
+from xml.sax.saxutils import escape, quoteattr
+
+from causality_lang import LIGHTBLUE, LIGHTGREEN, Graph, Node_manager, format_str
+
+
+# what _records yields: ("node", path, node), ("child", parent path, path),
+# ("connection", origin path, connection type, target path), ("placeholder", name)
+_Record = tuple[Any, ...]
+
+
+def _records(graph: Graph) -> Iterator[_Record]:
+    """The graph as records for the exporters, breadth first"""
+    paths: dict[int, str] = {}
+    frontier: deque[tuple[str | None, Node_manager]] = deque([(None, graph.nodes)])
+    order: list[tuple[str | None, Node_manager]] = []
+    # paths first, connections can point anywhere
+    while frontier:
+        parent, manager = entry = frontier.popleft()
+        order.append(entry)
+        for node in manager.get_all():
+            path = paths[id(node)] = manager.path_of(node.id)
+            frontier.append((path, node.children))
+
+    placeholders: dict[str, None] = {}
+    for parent, manager in order:
+        for node in manager.get_all():
+            path = paths[id(node)]
+            yield "node", path, node
+            if parent is not None:
+                yield "child", parent, path
+            for conn_type, dests in node.connections._conns.items():
+                for dest in dests:
+                    if (target := paths.get(id(dest))) is None:
+                        target = dest.id
+                        placeholders[target] = None
+                    yield "connection", path, conn_type, target
+    for name in placeholders:
+        yield "placeholder", name
+
+
+def _jsonl_lines(records: Iterable[_Record]) -> Iterator[str]:
+    # one object per record, written out by hand: json.dumps per line is 3x slower
+    quote = encode_basestring
+    for record in records:
+        kind = record[0]
+        if kind == "node":
+            _, path, node = record
+            yield (
+                f'{{"type": "node", "id": {quote(path)}, "alias": {quote(node.id)}, '
+                f'"name": {quote(node.name)}, "content": {quote(node.content)}}}\n'
+            )
+        elif kind == "child":
+            _, parent, path = record
+            yield (
+                f'{{"type": "child", "parent": {quote(parent)}, '
+                f'"child": {quote(path)}}}\n'
+            )
+        elif kind == "connection":
+            _, origin, conn_type, target = record
+            yield (
+                f'{{"type": "connection", "origin": {quote(origin)}, '
+                f'"connection": {quote(conn_type)}, "target": {quote(target)}}}\n'
+            )
+        else:
+            yield f'{{"type": "node", "id": {quote(record[1])}, "placeholder": true}}\n'
+
+
+def _dot_id(text: str) -> str:
+    text = text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{text}"'
+
+
+def _dot_lines(records: Iterable[_Record]) -> Iterator[str]:
+    yield "digraph nodelang {\n"
+    for record in records:
+        kind = record[0]
+        if kind == "node":
+            _, path, node = record
+            yield f"  {_dot_id(path)} [label={_dot_id(node.name)}];\n"
+        elif kind == "child":
+            yield f"  {_dot_id(record[1])} -> {_dot_id(record[2])} [style=dashed];\n"
+        elif kind == "connection":
+            _, origin, conn_type, target = record
+            label = _dot_id(conn_type)
+            yield f"  {_dot_id(origin)} -> {_dot_id(target)} [label={label}];\n"
+        else:
+            yield f"  {_dot_id(record[1])} [style=dotted];\n"
+    yield "}\n"
+
+
+def _graphml_lines(records: Iterable[_Record]) -> Iterator[str]:
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+        '  <key id="alias" for="node" attr.name="alias" attr.type="string"/>\n'
+        '  <key id="name" for="node" attr.name="name" attr.type="string"/>\n'
+        '  <key id="content" for="node" attr.name="content" attr.type="string"/>\n'
+        '  <key id="placeholder" for="node" attr.name="placeholder" '
+        'attr.type="boolean"><default>false</default></key>\n'
+        '  <key id="kind" for="edge" attr.name="kind" attr.type="string"/>\n'
+        '  <key id="connection" for="edge" attr.name="connection" '
+        'attr.type="string"/>\n'
+        '  <graph id="nodelang" edgedefault="directed">\n'
+    )
+    for record in records:
+        kind = record[0]
+        if kind == "node":
+            _, path, node = record
+            yield (
+                f"    <node id={quoteattr(path)}>"
+                f'<data key="alias">{escape(node.id)}</data>'
+                f'<data key="name">{escape(node.name)}</data>'
+                f'<data key="content">{escape(node.content)}</data></node>\n'
+            )
+        elif kind == "child":
+            yield (
+                f"    <edge source={quoteattr(record[1])} "
+                f'target={quoteattr(record[2])}><data key="kind">child</data>'
+                "</edge>\n"
+            )
+        elif kind == "connection":
+            _, origin, conn_type, target = record
+            yield (
+                f"    <edge source={quoteattr(origin)} target={quoteattr(target)}>"
+                '<data key="kind">connection</data>'
+                f'<data key="connection">{escape(conn_type)}</data></edge>\n'
+            )
+        else:
+            yield (
+                f"    <node id={quoteattr(record[1])}>"
+                '<data key="placeholder">true</data></node>\n'
+            )
+    yield "  </graph>\n</graphml>\n"
+
+
+def _text_lines(graph: Graph, color: bool) -> Iterator[str]:
+    """Top-level nodes with their children and connections, as health_check shows"""
+
+    def paint(text: str, shade: tuple[int, int, int]) -> str:
+        return format_str(text, shade) if color else text
+
+    children = paint("Children:", LIGHTBLUE)
+    connections = paint("Connections:", LIGHTBLUE)
+    for node in graph.nodes.get_all():
+        yield f"\n{paint(node.name, LIGHTGREEN)} ({node.id}):\n"
+        yield f"  Content: {node.content}\n"
+        if kids := node.children.get_all():
+            yield f"  {children}\n"
+            for child in kids:
+                yield f"    • {child.name}: {child.content}\n"
+        if node.connections._conns:
+            yield f"  {connections}\n"
+            for conn_type, dests in node.connections._conns.items():
+                for dest in dests:
+                    yield f"    • {conn_type} → {dest.name} ({dest.id})\n"
+
+
+_EXPORTERS: dict[str, Callable[[Iterable[_Record]], Iterator[str]]] = {
+    "jsonl": _jsonl_lines,
+    "dot": _dot_lines,
+    "graphml": _graphml_lines,
+}
+EXPORT_FORMATS = (*_EXPORTERS, "text")
+
+
+def export_lines(graph: Graph, format: str, color: bool = False) -> Iterator[str]:
+    """Graph.export_lines"""
+    if format == "text":
+        return _text_lines(graph, color)
+    if (lines := _EXPORTERS.get(format)) is None:
+        raise ValueError(f"Unknown export format {format!r}")
+    return lines(_records(graph))
@@ -0,0 +1,126 @@
+"""
+Parsed files kept on disk as compiled graphs, see Graph.parse_file.
+"""
+
+from __future__ import annotations
+from contextlib import suppress
+import hashlib
+import json
+import os
+
+from causality_lang import Graph, Unresolved_reference, _gc_paused
+from compiled import COMPILED_VERSION, Compact_graph
+
+
+PARSER_VERSION = "3"  # bump whenever the same source would parse differently
+
+
+_CHUNK_SIZE = 2**20  # bytes hashed at a time, see Parse_cache.key_file
+
+
+class Parse_cache:
+    """
+    Graphs of parsed files, stored as compiled graphs (plus their unresolved
+    references) under a hash of the file's bytes, its encoding and the parser
+    version. The least recently used entries are evicted to keep the directory
+    under max_bytes. hits, misses and evictions count what this instance did.
+    """
+
+    def __init__(self, directory: str | None = None, max_bytes: int = 256 * 2**20):
+        if directory is None:
+            home_cache = os.path.join(os.path.expanduser("~"), ".cache")
+            directory = os.path.join(
+                os.environ.get("XDG_CACHE_HOME") or home_cache, "causality_lang"
+            )
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hasher(self, encoding: str = "utf-8") -> hashlib._Hash:
+        """What key hashes the bytes of a file with, before any of them"""
+        return hashlib.sha256(
+            f"{PARSER_VERSION}\0{COMPILED_VERSION}\0{encoding}\0".encode()
+        )
+
+    def key(self, data: bytes, encoding: str = "utf-8") -> str:
+        digest = self.hasher(encoding)
+        digest.update(data)
+        return digest.hexdigest()
+
+    def key_file(self, path: str, encoding: str = "utf-8") -> str:
+        """key of the file at path, read a chunk at a time"""
+        digest = self.hasher(encoding)
+        with open(path, "rb") as f:
+            while chunk := f.read(_CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        stem = os.path.join(self.directory, key)
+        return f"{stem}.nlc", f"{stem}.json"
+
+    def get(self, key: str) -> tuple[Compact_graph, list[Unresolved_reference]] | None:
+        graph_path, refs_path = self._paths(key)
+        try:
+            compact = Compact_graph.load(graph_path)
+            with open(refs_path, encoding="utf-8") as f, _gc_paused():
+                refs = [
+                    Unresolved_reference(name, origin, connection, line, None, position)
+                    for name, origin, connection, line, position in json.load(f)
+                ]
+            os.utime(graph_path)  # the modification time is when it was last used
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return compact, refs
+
+    def put(self, key: str, graph: Graph):
+        graph_path, refs_path = self._paths(key)
+        temp = f"{refs_path}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            refs = graph.unresolved()
+            json.dump([[*ref[:4], ref.position] for ref in refs], f)
+        os.replace(temp, refs_path)
+        # written last, entries without it aren't used
+        graph.save_compiled(graph_path)
+        self._evict()
+
+    def _entries(self) -> dict[str, tuple[int, float]]:
+        """key -> (bytes, last used)"""
+        entries: dict[str, tuple[int, float]] = {}
+        for entry in os.scandir(self.directory):
+            key, ext = os.path.splitext(entry.name)
+            if ext not in (".nlc", ".json"):
+                continue
+            stat = entry.stat()
+            size, used = entries.get(key, (0, 0.0))
+            if ext == ".nlc":
+                used = stat.st_mtime
+            entries[key] = (size + stat.st_size, used)
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            for path in self._paths(key):
+                with suppress(OSError):
+                    os.remove(path)
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> dict[str, int]:
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for size, _ in entries.values()),
+        }
@@ -1,3 +1,17 @@
 from setuptools import setup, find_packages
 
-setup(name="causality_lang", packages=find_packages(), version="0.1")
+setup(
+    name="causality_lang",
+    packages=find_packages(),
+    py_modules=[
+        "causality_lang",
+        "analytics",
+        "causal_query",
+        "compiled",
+        "exporters",
+        "parse_cache",
+        "project",
+    ],
+    version="0.1",
+    extras_require={"analytics": ["numpy", "scipy"]},
+)
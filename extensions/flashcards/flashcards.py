@@ -1,8 +1,10 @@
 # flashcards essentially ask about the edges of the graph
 # from typing import TYPE_CHECKING
+from collections import deque
 from dataclasses import dataclass
+from typing import Iterator
 import os
-from causality_lang import Node, Node_manager, Graph
+from causality_lang import Change_log, Node, Node_manager, Graph
 
 
 @dataclass
@@ -11,6 +13,13 @@ class Question:
     answer: str
 
 
+@dataclass
+class Card(Question):
+    # stable across refreshes and parses: the dotted path of the child a card asks
+    # about, or "origin path <connection type>" for connections
+    id: str
+
+
 _graph: Graph | None = None
 _questions: list[Question] = []
 
@@ -20,18 +29,212 @@ def load(graph: Graph):
     _graph = graph
 
 
-def attribute_questions(graph: Graph | None = None):
+def attribute_questions(graph: Graph | None = None) -> list[Question]:
+    """The child attribute questions of the top-level nodes, in _questions"""
     graph = graph or _graph
     assert graph is not None
-    nodes = graph.nodes
-    for node in nodes.get_all():
+    _questions.clear()
+    for node in graph.nodes.get_all():
         for child in node.children.get_all():
-            _questions.append(
-                Question(
-                    question=f"{node.content} . {child.name} = ?",
-                    answer=f"{child.content}",
-                )
-            )
+            card = _child_card(node, child, node.id)
+            _questions.append(Question(card.question, card.answer))
+    return _questions
+
+
+def _child_card(node: Node, child: Node, path: str) -> Card:
+    return Card(
+        question=f"{node.content} . {child.name} = ?",
+        answer=f"{child.content}",
+        id=f"{path}.{child.id}",
+    )
+
+
+def _cards_of(node: Node, path: str) -> Iterator[Card]:
+    """The cards node owns: one per child, one per connection type"""
+    for child in node.children.get_all():
+        yield _child_card(node, child, path)
+    for conn_type, dests in node.connections._conns.items():
+        yield Card(
+            question=f"{node.name} <{conn_type}> ?",
+            answer=" & ".join(dest.name for dest in dests),
+            id=f"{path} <{conn_type}>",
+        )
+
+
+class FlashcardDeck:
+    """
+    The cards of a graph, made the first time they are asked for.
+    Every node owns the cards about its children and its connections, refresh()
+    only makes the cards of the nodes that changed since the deck was made again,
+    as a Change_log of the graph tells it.
+    """
+
+    def __init__(self, graph: Graph) -> None:
+        self.graph = graph
+        self._cards: dict[str, Card] = {}
+        self._owned: dict[str, list[str]] = {}  # node path -> ids of its cards
+        # id(node) -> paths of the nodes whose connection cards name it
+        self._named_by: dict[int, set[str]] = {}
+        self._nodes: dict[str, Node] = {}  # path -> node the cards were made of
+        self._kids: dict[str, set[str]] = {}  # path, "" for the top -> child paths
+        # id(node), id of its children or connections -> it and the node's path
+        self._where: dict[int, tuple[object, str]] = {}
+        self._root: Node_manager | None = None
+        self._log: Change_log | None = None  # what changed since the cards were made
+        self._complete = False
+
+    def __iter__(self) -> Iterator[Card]:
+        if self._complete:
+            return iter(self._cards.values())
+        return self._generate()
+
+    def __len__(self) -> int:
+        self._finish()
+        return len(self._cards)
+
+    def __contains__(self, id: str) -> bool:
+        self._finish()
+        return id in self._cards
+
+    def __getitem__(self, id: str) -> Card:
+        self._finish()
+        return self._cards[id]
+
+    def _finish(self):
+        if not self._complete:
+            for _ in self._generate():
+                pass
+
+    def _generate(self) -> Iterator[Card]:
+        """Walk the graph breadth first, keeping the cards as they are made"""
+        self._reset()
+        self._log = Change_log()
+        root = self._root = self.graph.nodes
+        self._where[id(root)] = (root, "")
+        self._kids[""] = set()
+        for path, node in _walk(root):
+            self._place(path, node)
+            yield from self._make(path, node)
+        self._complete = True
+
+    def _reset(self):
+        self._cards.clear()
+        self._owned.clear()
+        self._named_by.clear()
+        self._nodes.clear()
+        self._kids.clear()
+        self._where.clear()
+        self._root = self._log = None
+        self._complete = False
+
+    def _place(self, path: str, node: Node):
+        """Keep where node is, so its changes can be told apart"""
+        self._nodes[path] = node
+        self._kids[path] = set()
+        self._kids[path.rpartition(".")[0]].add(path)
+        for part in (node, node.children, node.connections):
+            self._where[id(part)] = (part, path)
+
+    def _make(self, path: str, node: Node) -> Iterator[Card]:
+        owned = self._owned[path] = []
+        for card in _cards_of(node, path):
+            self._cards[card.id] = card
+            owned.append(card.id)
+            yield card
+        for dests in node.connections._conns.values():
+            for dest in dests:
+                self._named_by.setdefault(id(dest), set()).add(path)
+
+    def refresh(self) -> tuple[list[Card], list[str]]:
+        """
+        Bring the cards up to date with the graph.
+        Returns the cards that are new or changed and the ids of the cards that went.
+        """
+        if not self._complete or self.graph.nodes is not self._root:
+            # nothing to compare against, the next walk makes everything
+            self._reset()
+            return [], []
+
+        # a node's cards show its name and content, its children's and the names
+        # of what it connects to, children added or removed change the tree too
+        dirty: set[str] = set()
+        moved: set[str] = set()
+        for part in self._log.take():
+            if (where := self._where.get(id(part))) is None or where[0] is not part:
+                continue  # made since, or no longer in the graph
+            path = where[1]
+            if isinstance(part, Node):
+                dirty.add(path.rpartition(".")[0])
+                dirty.update(self._named_by.get(id(part), ()))
+            elif isinstance(part, Node_manager):
+                moved.add(path)
+            dirty.add(path)
+
+        old: dict[str, Card] = {}
+        made: list[Card] = []
+        fresh: set[str] = set()  # paths whose cards were just made
+        for path in sorted(moved, key=len):
+            if path and path not in self._nodes:
+                continue  # went with a node above it
+            manager = self._nodes[path].children if path else self._root
+            now = {manager.path_of(node.id): node for node in manager.get_all()}
+            for kid in list(self._kids[path]):
+                if now.get(kid) is not self._nodes[kid]:
+                    self._drop(kid, old)
+            for kid, node in now.items():
+                if kid not in self._nodes:
+                    fresh.update(self._add(kid, node, old, made))
+        for path in dirty - fresh:
+            if path in self._nodes:
+                old.update(self._forget(path))
+                self._remake(path, old, made)
+        return made, sorted(old)
+
+    def _add(
+        self, path: str, node: Node, old: dict[str, Card], made: list[Card]
+    ) -> list[str]:
+        """Place node and the nodes under it and make their cards, returns the paths"""
+        added = []
+        frontier = deque([(path, node)])
+        while frontier:
+            path, node = frontier.popleft()
+            self._place(path, node)
+            self._remake(path, old, made)
+            added.append(path)
+            kids = node.children
+            frontier.extend((kids.path_of(kid.id), kid) for kid in kids.get_all())
+        return added
+
+    def _remake(self, path: str, old: dict[str, Card], made: list[Card]):
+        for card in self._make(path, self._nodes[path]):
+            if old.pop(card.id, None) != card:
+                made.append(card)
+
+    def _drop(self, path: str, old: dict[str, Card]):
+        """Take the node at path and the nodes under it out of the deck"""
+        self._kids[path.rpartition(".")[0]].discard(path)
+        frontier = [path]
+        while frontier:
+            path = frontier.pop()
+            node = self._nodes.pop(path)
+            for part in (node, node.children, node.connections):
+                del self._where[id(part)]
+            frontier.extend(self._kids.pop(path))
+            old.update(self._forget(path))
+
+    def _forget(self, path: str) -> dict[str, Card]:
+        """Drop the cards of the node at path, returning them"""
+        return {id: self._cards.pop(id) for id in self._owned.pop(path, [])}
+
+
+def _walk(nodes: Node_manager) -> Iterator[tuple[str, Node]]:
+    """(dotted path, node) for every node, breadth first"""
+    frontier = deque([nodes])
+    while frontier:
+        manager = frontier.popleft()
+        for node in manager.get_all():
+            yield manager.path_of(node.id), node
+            frontier.append(node.children)
 
 
 def health_check():
@@ -49,8 +252,28 @@ def health_check():
     global nodes
     nodes = node_manager.get_all()
     attribute_questions(g)
+    attribute_questions(g)
+    assert len(_questions) == 2
+
+    deck = FlashcardDeck(g)
+    assert {card.id for card in deck} == {
+        "protref.causes",
+        "protref.effects",
+        "protref <caused>",
+    }
+    g.parse("religious diversity (reldiv2) : more than one religion")
+    assert deck.refresh() == ([], [])
+    g.nodes.get("reldiv").redefine("diversity", "many religions")
+    made, gone = deck.refresh()
+    assert [card.id for card in made] == ["protref <caused>"] and not gone
+    assert deck["protref <caused>"].answer == "diversity"
+    g.nodes.get("protref").children.remove("effects")
+    g.parse("printing press (press) : movable type\npress < (type) metal letters")
+    made, gone = deck.refresh()
+    assert [card.id for card in made] == ["press.type"] and gone == ["protref.effects"]
 
 
 if __name__ == "__main__":
     health_check()
     print(_questions)
+    print(list(FlashcardDeck(_graph)) if _graph is not None else [])
@@ -0,0 +1,221 @@
+# spaced repetition (SM-2) for flashcards, review state kept in a SQLite file
+from typing import Callable, Iterable, NamedTuple
+import heapq
+import itertools
+import sqlite3
+import time
+
+DAY = 86400.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    id TEXT PRIMARY KEY,
+    repetitions INTEGER NOT NULL,
+    interval REAL NOT NULL,
+    ease REAL NOT NULL,
+    due REAL NOT NULL,
+    lapses INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS reviews (
+    card_id TEXT NOT NULL,
+    reviewed REAL NOT NULL,
+    quality INTEGER NOT NULL,
+    interval REAL NOT NULL,
+    ease REAL NOT NULL
+);
+"""
+# the same statements every time, so sqlite3 prepares them once
+_LOAD = "SELECT id, due FROM cards"
+_LOAD_CARD = (
+    "SELECT id, repetitions, interval, ease, due, lapses FROM cards WHERE id = ?"
+)
+_SAVE_CARD = "INSERT OR REPLACE INTO cards VALUES (?, ?, ?, ?, ?, ?)"
+_SAVE_REVIEW = "INSERT INTO reviews VALUES (?, ?, ?, ?, ?)"
+
+
+class CardState(NamedTuple):
+    # laid out like the rows of the cards table
+    id: str
+    repetitions: int = 0  # successful reviews in a row
+    interval: float = 0.0  # days until the next review
+    ease: float = 2.5
+    due: float = 0.0  # unix time
+    lapses: int = 0
+
+
+def sm2(state: CardState, quality: int, now: float) -> CardState:
+    """The state after a review graded quality (0 forgot - 5 perfect) at now"""
+    if not 0 <= quality <= 5:
+        raise ValueError(f"Quality must be between 0 and 5, got {quality}")
+    repetitions, interval, lapses = state.repetitions, state.interval, state.lapses
+    if quality < 3:
+        repetitions, interval, lapses = 0, 1.0, lapses + 1
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1.0
+        elif repetitions == 2:
+            interval = 6.0
+        else:
+            interval = float(round(interval * state.ease))
+    miss = 5 - quality
+    ease = max(1.3, state.ease + 0.1 - miss * (0.08 + miss * 0.02))
+    due = now + interval * DAY
+    return CardState(state.id, repetitions, interval, ease, due, lapses)
+
+
+class Scheduler:
+    """
+    Review state of cards by their stable ids, with the cards due soonest in a
+    heap: next_card() and review() are O(log n). Nothing is scheduled until sync().
+    Reviews are written to path in batches of batch_size, and on flush()/close().
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        batch_size: int = 512,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.clock = clock
+        self.batch_size = batch_size
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+        # when every card is due; the rest of a state is only read when it is needed
+        self._due: dict[str, float] = dict(self._db.execute(_LOAD).fetchall())
+        self._saved = set(self._due)  # cards with a row to read
+        self._states: dict[str, CardState] = {}
+        # (due, seq, id), entries whose seq isn't _queued[id] any more are stale
+        self._heap: list[tuple[float, int, str]] = []
+        self._queued: dict[str, int] = {}
+        self._seq = 0
+        self._dirty: set[str] = set()
+        self._log: list[tuple[str, float, int, float, float]] = []
+
+    def __enter__(self) -> "Scheduler":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._queued
+
+    def state(self, id: str) -> CardState:
+        if (state := self._states.get(id)) is None:
+            if id in self._saved:
+                state = CardState._make(self._db.execute(_LOAD_CARD, (id,)).fetchone())
+            else:
+                state = CardState(id, due=self._due[id])  # never reviewed
+            self._states[id] = state
+        return state
+
+    def sync(self, ids: Iterable[str] | None = None):
+        """
+        Schedule exactly the cards ids (a FlashcardDeck's card ids, say), or every
+        card reviewed before. Cards keep their state, new ones are due now, in order.
+        """
+        now = self.clock()
+        due = self._due
+        queued = dict.fromkeys(due if ids is None else ids)
+        queued.update(zip(queued, itertools.count(self._seq)))
+        self._seq += len(queued)
+        get = due.setdefault
+        heap = [(get(id, now), number, id) for id, number in queued.items()]
+        heapq.heapify(heap)
+        self._heap, self._queued = heap, queued
+
+    def _top(self) -> tuple[float, int, str] | None:
+        heap, queued = self._heap, self._queued
+        while heap and queued.get(heap[0][2]) != heap[0][1]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def next_card(self, now: float | None = None) -> str | None:
+        """The id of the card most overdue at now, None when nothing is due"""
+        if (top := self._top()) is None:
+            return None
+        due, _, id = top
+        return id if due <= (self.clock() if now is None else now) else None
+
+    def next_due(self) -> float | None:
+        """When the next card is due"""
+        return top[0] if (top := self._top()) is not None else None
+
+    def due_count(self, now: float | None = None) -> int:
+        now = self.clock() if now is None else now
+        due = self._due
+        return sum(due[id] <= now for id in self._queued)
+
+    def review(self, id: str, quality: int, now: float | None = None) -> CardState:
+        """Grade a review of the card, 0 (forgot) to 5 (perfect)"""
+        if id not in self._queued:
+            raise KeyError(id)
+        now = self.clock() if now is None else now
+        state = self._states[id] = sm2(self.state(id), quality, now)
+        self._due[id] = state.due
+        self._queued[id] = number = self._seq
+        self._seq += 1
+        heapq.heappush(self._heap, (state.due, number, id))
+        self._dirty.add(id)
+        self._log.append((id, now, quality, state.interval, state.ease))
+        if len(self._log) >= self.batch_size:
+            self.flush()
+        return state
+
+    def flush(self):
+        """Write the reviews not written yet, in one transaction"""
+        if not self._log and not self._dirty:
+            return
+        with self._db:
+            self._db.executemany(_SAVE_CARD, [self._states[id] for id in self._dirty])
+            self._db.executemany(_SAVE_REVIEW, self._log)
+        self._dirty.clear()
+        self._log.clear()
+
+    def history(self, id: str) -> list[tuple[float, int, float, float]]:
+        """(time, quality, interval, ease) of every review of the card"""
+        self.flush()
+        return self._db.execute(
+            "SELECT reviewed, quality, interval, ease FROM reviews"
+            " WHERE card_id = ? ORDER BY reviewed",
+            (id,),
+        ).fetchall()
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+
+def health_check():
+    import os
+    import tempfile
+
+    now = [1_000_000.0]
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "reviews.sqlite")
+        with Scheduler(path, batch_size=2, clock=lambda: now[0]) as scheduler:
+            scheduler.sync(["a.x", "a.y", "a <caused>"])
+            assert scheduler.next_card() == "a.x"
+            scheduler.review("a.x", 5)
+            assert scheduler.next_card() == "a.y"
+            scheduler.review("a.y", 1)
+            scheduler.review("a <caused>", 4)
+            assert scheduler.next_card() is None
+            now[0] += DAY
+            assert scheduler.due_count() == 3
+
+        # the state comes back, and survives the deck being made again
+        with Scheduler(path, clock=lambda: now[0]) as scheduler:
+            scheduler.sync(["a.y", "a.x", "a.z"])
+            assert scheduler.next_card() == "a.y" and scheduler.due_count() == 3
+            assert scheduler.state("a.x").repetitions == 1
+            assert scheduler.state("a.y").lapses == 1
+            assert len(scheduler.history("a.x")) == 1
+
+
+if __name__ == "__main__":
+    health_check()
@@ -0,0 +1,96 @@
+# completes node references while typing, from the graph of the last parse
+
+import re
+from typing import Callable
+from PySide6.QtCore import QStringListModel, Qt, Slot
+from PySide6.QtWidgets import QCompleter, QTextEdit
+
+from causality_lang import Graph
+
+_REFERENCE = re.compile(r"[\w.]+$")  # the alias or dotted path before the cursor
+_PICK = {
+    Qt.Key.Key_Enter,
+    Qt.Key.Key_Return,
+    Qt.Key.Key_Escape,
+    Qt.Key.Key_Tab,
+    Qt.Key.Key_Backtab,
+}
+
+
+class CompletingTextEdit(QTextEdit):
+    """A QTextEdit that asks its completer for completions as keys are typed"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.completer: AliasCompleter | None = None
+
+    def keyPressEvent(self, event):
+        completer = self.completer
+        if completer is not None and completer.popup().isVisible():
+            if event.key() in _PICK:
+                event.ignore()  # the completer takes these
+                return
+        super().keyPressEvent(event)
+        if completer is not None and event.text():
+            completer.refresh()
+
+
+class AliasCompleter(QCompleter):
+    """
+    Offers the dotted paths and aliases that start with the one being typed,
+    or nearly do, looked up in the prefix index of graph().
+    """
+
+    def __init__(
+        self,
+        editor: CompletingTextEdit,
+        graph: Callable[[], Graph | None],
+        count: int = 10,
+        min_length: int = 2,
+    ):
+        super().__init__(editor)
+        self.editor = editor
+        self.graph = graph
+        self.count = count
+        self.min_length = min_length
+        self._prefix = ""
+        self._keys = QStringListModel(self)
+        self.setModel(self._keys)
+        self.setWidget(editor)
+        # the index has already picked, typos and all
+        self.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.activated.connect(self.insert)
+        editor.completer = self
+
+    @Slot()
+    def refresh(self):
+        popup = self.popup()
+        cursor = self.editor.textCursor()
+        before = cursor.block().text()[: cursor.positionInBlock()]
+        match = _REFERENCE.search(before)
+        graph = self.graph()
+        if graph is None or match is None or len(match.group()) < self.min_length:
+            popup.hide()
+            return
+        self._prefix = match.group()
+        keys = [key for key, _ in graph.complete(self._prefix, self.count, fuzzy=True)]
+        if not keys or keys == [self._prefix]:
+            popup.hide()
+            return
+        self._keys.setStringList(keys)
+        rect = self.editor.cursorRect()
+        rect.setWidth(
+            popup.sizeHintForColumn(0) + popup.verticalScrollBar().sizeHint().width()
+        )
+        self.complete(rect)
+        popup.setCurrentIndex(self._keys.index(0))
+
+    @Slot(str)
+    def insert(self, key: str):
+        # replaces what was typed, it may have had a typo
+        cursor = self.editor.textCursor()
+        cursor.movePosition(
+            cursor.MoveOperation.Left, cursor.MoveMode.KeepAnchor, len(self._prefix)
+        )
+        cursor.insertText(key)
+        self.editor.setTextCursor(cursor)
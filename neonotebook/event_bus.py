@@ -1,16 +1,178 @@
-from PySide6.QtCore import QObject, Slot, Signal
+# publish / subscribe between the parts of a notebook, delivered a tick at a time
 
-class EventPublisher(QObject):
-    file_operation = Signal(dict)
-    def __init__(self):
-        super().__init__()
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Generic, TypeVar
+from PySide6.QtCore import QObject, QThreadPool, Qt, Signal, Slot
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True, eq=False)
+class Topic(Generic[T]):
+    name: str
+    payload: type[T]
+    # only the newest payload of a tick is delivered, for bursts of updates
+    coalesce: bool = False
+    # payloads kept until the next tick, the oldest are dropped past it
+    max_queue: int = 4096
+
+
+FILE = Topic("file", dict)
+PARSE_RESULT = Topic("parse_result", dict, coalesce=True)
+TEXT_CHANGED = Topic("text_changed", int, coalesce=True)
+
+
+@dataclass
+class TopicMetrics:
+    published: int = 0
+    delivered: int = 0  # payloads handed to subscribers, once per subscriber
+    batches: int = 0
+    coalesced: int = 0
+    dropped: int = 0
+    max_depth: int = 0
+    latency_total: float = 0.0  # seconds from the oldest publish to dispatch
+    latency_max: float = 0.0
+
+    @property
+    def latency_mean(self) -> float:
+        return self.latency_total / self.batches if self.batches else 0.0
+
+
+@dataclass
+class _Subscriber:
+    callback: Callable
+    batch: bool  # called with the list of a tick's payloads, not each one
+    threaded: bool  # called on QThreadPool.globalInstance()
 
-    def emit_file_action(self, type, args): 
-        self.file_operation.emit({"type":type, "args":args})
 
 class EventBus(QObject):
-    def __init__(self, events):
+    """
+    Topics are published to from any thread and delivered on the bus's thread,
+    everything published in a tick in one batch. Coalescing topics only deliver
+    the newest payload of a tick, the rest are counted in metrics().
+    """
+
+    _wake = Signal()
+
+    def __init__(self):
         super().__init__()
+        self._subscribers: dict[Topic, list[_Subscriber]] = {}
+        self._lock = threading.Lock()
+        # topic -> (payloads, when the oldest was published)
+        self._pending: dict[Topic, tuple[deque, float]] = {}
+        self._scheduled = False
+        self._metrics: dict[Topic, TopicMetrics] = {}
+        self._wake.connect(self._dispatch, Qt.ConnectionType.QueuedConnection)
+
+    def subscribe(
+        self,
+        topic: Topic[T],
+        callback: Callable,
+        batch: bool = False,
+        threaded: bool = False,
+    ):
+        """
+        Call callback with every payload of topic, or the list of them a tick with
+        batch. threaded callbacks run on the global QThreadPool.
+        """
+        subscriber = _Subscriber(callback, batch, threaded)
+        self._subscribers.setdefault(topic, []).append(subscriber)
+
+    def unsubscribe(self, topic: Topic, callback: Callable):
+        subscribers = self._subscribers.get(topic, [])
+        subscribers[:] = [s for s in subscribers if s.callback != callback]
+
+    def publish(self, topic: Topic[T], payload: T):
+        if not isinstance(payload, topic.payload):
+            raise TypeError(
+                f"{topic.name} takes {topic.payload.__name__},"
+                f" got {type(payload).__name__}"
+            )
+        with self._lock:
+            if (metrics := self._metrics.get(topic)) is None:
+                metrics = self._metrics[topic] = TopicMetrics()
+            metrics.published += 1
+            if (pending := self._pending.get(topic)) is None:
+                pending = self._pending[topic] = (deque(), time.perf_counter())
+            payloads = pending[0]
+            if topic.coalesce and payloads:
+                payloads[0] = payload
+                metrics.coalesced += 1
+            else:
+                if len(payloads) == topic.max_queue:
+                    payloads.popleft()
+                    metrics.dropped += 1
+                payloads.append(payload)
+            metrics.max_depth = max(metrics.max_depth, len(payloads))
+            wake = not self._scheduled
+            self._scheduled = True
+        if wake:
+            self._wake.emit()
+
+    @Slot()
+    def _dispatch(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._scheduled = False
+        now = time.perf_counter()
+        pool = None
+        for topic, (payloads, since) in pending.items():
+            batch = list(payloads)
+            subscribers = self._subscribers.get(topic, ())
+            with self._lock:
+                metrics = self._metrics[topic]
+                metrics.batches += 1
+                metrics.latency_total += now - since
+                metrics.latency_max = max(metrics.latency_max, now - since)
+                metrics.delivered += len(batch) * len(subscribers)
+            for subscriber in list(subscribers):
+                if subscriber.threaded:
+                    pool = pool or QThreadPool.globalInstance()
+                    pool.start(_call(subscriber, batch))
+                else:
+                    _call(subscriber, batch)()
+
+    def queue_depth(self) -> int:
+        """Payloads waiting for the next tick"""
+        with self._lock:
+            return sum(len(payloads) for payloads, _ in self._pending.values())
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "queue_depth": sum(len(p) for p, _ in self._pending.values()),
+                "topics": {
+                    topic.name: asdict(metrics) | {"latency_mean": metrics.latency_mean}
+                    for topic, metrics in self._metrics.items()
+                },
+            }
+
+
+def _call(subscriber: _Subscriber, batch: list) -> Callable[[], None]:
+    def call():
+        if subscriber.batch:
+            subscriber.callback(batch)
+        else:
+            for payload in batch:
+                subscriber.callback(payload)
+
+    return call
+
+
+class EventPublisher(EventBus):
+    # the events every notebook publishes
+
+    def emit_file_action(self, type, args):
+        self.publish(FILE, {"type": type, "args": args})
+
+    def emit_parse_result(self, graph, diagnostics, seconds):
+        self.publish(
+            PARSE_RESULT,
+            {"graph": graph, "diagnostics": diagnostics, "seconds": seconds},
+        )
 
-    @Slot(dict)
-    def on_command(self, msg): print(msg)
\ No newline at end of file
+    def emit_text_changed(self, revision):
+        self.publish(TEXT_CHANGED, revision)
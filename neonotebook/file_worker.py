@@ -0,0 +1,234 @@
+# opens and saves the notebook's file off the ui thread
+
+import os
+import stat
+import tempfile
+from PySide6.QtCore import QObject, QThread, QTimer, Signal, Slot
+from PySide6.QtGui import QTextCursor
+from PySide6.QtWidgets import QProgressBar, QTextEdit
+
+from event_bus import EventPublisher
+
+CHUNK_SIZE = 1 << 16  # characters put into the editor at a time
+
+
+class FileWorker(QObject):
+    # generation, text, bytes read, file size, last chunk
+    chunk = Signal(int, str, int, int, bool)
+    saved = Signal(int, str)  # generation, path
+    failed = Signal(str, str)  # path, error
+
+    def __init__(self, latest_load, latest_save):
+        super().__init__()
+        # () -> generation of the newest job of each kind
+        self.latest_load = latest_load
+        self.latest_save = latest_save
+        self._file = None
+        self._path = ""
+        self._size = 0
+
+    @Slot(int, str)
+    def open(self, generation, path):
+        self._close()
+        try:
+            self._file = open(path, "rt", encoding="utf-8")
+            self._size = os.fstat(self._file.fileno()).st_size
+        except OSError as error:
+            self.failed.emit(path, str(error))
+            return
+        self._path = path
+        self.read(generation)
+
+    @Slot(int)
+    def read(self, generation):
+        # one chunk per request, so the editor is never sent more than it can take
+        if self._file is None:
+            return
+        if generation != self.latest_load():
+            self._close()  # another file is being opened
+            return
+        try:
+            text = self._file.read(CHUNK_SIZE)
+            done = self._file.buffer.tell()
+        except (OSError, UnicodeDecodeError) as error:
+            path = self._path
+            self._close()
+            self.failed.emit(path, str(error))
+            return
+        last = len(text) < CHUNK_SIZE
+        if last:
+            self._close()
+        self.chunk.emit(generation, text, done, self._size, last)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @Slot(int, str, str)
+    def save(self, generation, path, text):
+        # written next to path and renamed over it, so path is always whole
+        if generation != self.latest_save():
+            return  # a newer save is queued behind this one
+        folder, name = os.path.split(os.path.abspath(path))
+        temp = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                "wt", encoding="utf-8", dir=folder, prefix=f".{name}.", delete=False
+            ) as file:
+                temp = file.name
+                file.write(text)
+                file.flush()
+                os.fsync(file.fileno())
+            if os.path.exists(path):
+                os.chmod(temp, stat.S_IMODE(os.stat(path).st_mode))
+            os.replace(temp, path)
+        except OSError as error:
+            if temp is not None and os.path.exists(temp):
+                os.remove(temp)
+            self.failed.emit(path, str(error))
+            return
+        self.saved.emit(generation, path)
+
+
+class BackgroundFiles(QObject):
+    """
+    Opens files into editor a chunk at a time and saves them, the reading and
+    writing done on a thread of its own. A save goes to a temporary file that is
+    renamed over the file, so a crash never leaves half a notebook on disk.
+    With autosave the file is saved once typing has paused for autosave ms.
+    """
+
+    opened = Signal(str)
+    saved = Signal(str)
+    failed = Signal(str, str)  # path, error
+    _open = Signal(int, str)
+    _read = Signal(int)
+    _save = Signal(int, str, str)
+
+    def __init__(
+        self,
+        editor: QTextEdit,
+        events: EventPublisher,
+        progress: QProgressBar | None = None,
+        autosave: int | None = 2000,
+    ):
+        super().__init__()
+        self.editor = editor
+        self.events = events
+        self.progress = progress
+        self.path: str | None = None
+        self.loading = False
+        self._opening: str | None = None
+        self._loads = 0
+        self._saves = 0
+        self._edits = 0
+        self._saving_edits = 0  # _edits when the newest save was asked for
+
+        self.autosave = autosave is not None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._autosave)
+        if self.autosave:
+            self._timer.setInterval(autosave)
+        editor.document().contentsChanged.connect(self._changed)
+
+        self._thread = QThread(self)
+        self._worker = FileWorker(lambda: self._loads, lambda: self._saves)
+        self._worker.moveToThread(self._thread)
+        self._open.connect(self._worker.open)
+        self._read.connect(self._worker.read)
+        self._save.connect(self._worker.save)
+        self._worker.chunk.connect(self._chunk)
+        self._worker.saved.connect(self._saved)
+        self._worker.failed.connect(self._failed)
+        self._thread.start()
+
+    def open(self, path: str):
+        """Replace the text of editor with the file at path"""
+        self._loads += 1
+        self._timer.stop()
+        self.loading = True
+        self._opening = path
+        document = self.editor.document()
+        document.setUndoRedoEnabled(False)  # no undoing the load a chunk at a time
+        document.clear()
+        if self.progress is not None:
+            self.progress.setRange(0, 100)
+            self.progress.setValue(0)
+            self.progress.show()
+        self._open.emit(self._loads, path)
+
+    @Slot(int, str, int, int, bool)
+    def _chunk(self, generation, text, done, size, last):
+        if generation != self._loads:
+            return
+        cursor = QTextCursor(self.editor.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        if self.progress is not None and size:
+            self.progress.setValue(min(100, done * 100 // size))
+        if not last:
+            self._read.emit(generation)
+            return
+        self._loaded()
+        self.path = self._opening
+        self.editor.document().setModified(False)
+        self.events.emit_file_action("opened", {"path": self.path})
+        self.opened.emit(self.path)
+
+    def _loaded(self):
+        self.loading = False
+        self.editor.document().setUndoRedoEnabled(True)
+        if self.progress is not None:
+            self.progress.hide()
+
+    def save(self, path: str | None = None) -> bool:
+        """Save the text of editor to path, or the file it was opened from"""
+        path = path or self.path
+        if path is None or self.loading:
+            return False
+        self._timer.stop()
+        self._saves += 1
+        self._saving_edits = self._edits
+        self._save.emit(self._saves, path, self.editor.toPlainText())
+        return True
+
+    @Slot(int, str)
+    def _saved(self, generation, path):
+        self.path = path
+        if generation == self._saves and self._edits == self._saving_edits:
+            self.editor.document().setModified(False)  # nothing typed since
+        self.events.emit_file_action("saved", {"path": path})
+        self.saved.emit(path)
+
+    @Slot(str, str)
+    def _failed(self, path, error):
+        if self.loading and path == self._opening:
+            self._loaded()
+        self.events.emit_file_action("failed", {"path": path, "error": error})
+        self.failed.emit(path, error)
+
+    @Slot()
+    def _changed(self):
+        if self.loading:
+            return
+        self._edits += 1
+        if self.autosave and self.path is not None:
+            self._timer.start()
+
+    @Slot()
+    def _autosave(self):
+        if self.editor.document().isModified():
+            self.save()
+
+    def stop(self):
+        self._timer.stop()
+        self._loads += 1
+        self._thread.quit()
+        self._thread.wait()
+        modified = self.editor.document().isModified()
+        if self.autosave and modified and self.path and not self.loading:
+            # saves still queued went with the thread, the last one is made here
+            self._saves += 1
+            self._worker.save(self._saves, self.path, self.editor.toPlainText())
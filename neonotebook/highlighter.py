@@ -0,0 +1,265 @@
+# nodelang syntax highlighting for the notebook editor, see causality_lang/syntax.md
+
+import re
+import time
+from PySide6.QtCore import QObject
+from PySide6.QtGui import (
+    QColor,
+    QFont,
+    QSyntaxHighlighter,
+    QTextCharFormat,
+    QTextCursor,
+    QTextDocument,
+)
+
+_REFERENCE = re.compile(r"\|[^|]+\|")
+
+# block states: how many < a continuation line below may start with, -1 when no
+# definition is open (Qt's own default)
+NO_DEFINITION = -1
+
+
+def _no_alias(text, start, end):
+    """Whether "(sub-alias) content" in text[start:end] leaves the node unnamed"""
+    rest = text[start:end].strip()
+    if rest.startswith("(") and (close := rest.find(")")) != -1:
+        rest = rest[1:close] + rest[close + 1 :]
+    return not rest.strip()
+
+
+def _format(color, bold=False, italic=False):
+    fmt = QTextCharFormat()
+    fmt.setForeground(QColor(color))
+    if bold:
+        fmt.setFontWeight(QFont.Weight.Bold)
+    fmt.setFontItalic(italic)
+    return fmt
+
+
+class NodelangHighlighter(QSyntaxHighlighter):
+    """
+    Highlights one block (line) at a time, keeping as its state how deep a
+    < / << continuation may go after it. Qt only calls highlightBlock for the
+    edited block and then the blocks after it while their state keeps changing,
+    so a keystroke costs a line, not the document.
+    """
+
+    def __init__(self, document: QTextDocument | QObject):
+        super().__init__(document)
+        self.calls = 0  # highlightBlock calls, for benchmarks
+        self.formats = {
+            "vocab": _format("#7fff7f", bold=True),
+            "alias": _format("#7f7fff"),
+            "punct": _format("#a0a0a0"),
+            "node": _format("#e0c060"),
+            "connection": _format("#ff9f40", bold=True),
+            "reference": _format("#40c0ff", italic=True),
+            "annotation": _format("#808080", italic=True),
+        }
+        invalid = QTextCharFormat()
+        invalid.setUnderlineStyle(QTextCharFormat.UnderlineStyle.WaveUnderline)
+        invalid.setUnderlineColor(QColor("#ff4040"))
+        self.formats["invalid"] = invalid
+
+    def _paint(self, start, end, kind):
+        if end > start:
+            self.setFormat(start, end - start, self.formats[kind])
+
+    def _alias(self, text, start, end):
+        """Paint a leading (alias) in text[start:end], returns where it ends"""
+        while start < end and text[start].isspace():
+            start += 1
+        if not text.startswith("(", start, end):
+            return start
+        if (close := text.find(")", start, end)) == -1:
+            return start
+        self._paint(start, close + 1, "alias")
+        return close + 1
+
+    def _references(self, text, start, end):
+        for ref in _REFERENCE.finditer(text, start, end):
+            self._paint(ref.start(), ref.end(), "reference")
+
+    def highlightBlock(self, text):
+        # the same decisions causality_lang's lexer makes, in the same order
+        self.calls += 1
+        previous = self.previousBlockState()
+        end = len(text.rstrip())
+        start = len(text) - len(text.lstrip())
+        if start >= end or text.startswith("#", start):
+            self._paint(start, end, "annotation")
+            self.setCurrentBlockState(previous)
+            return
+
+        # < and << continue the definition above, see syntax.md
+        if text.startswith("<", start) and text.find(">", start, end) == -1:
+            depth = len(text) - len(text[start:].lstrip("<")) - start
+            if depth > previous:
+                # no definition, or no < line for a << to go under
+                self._paint(start, end, "invalid")
+                self.setCurrentBlockState(NO_DEFINITION)
+                return
+            if _no_alias(text, start + depth, end):
+                # nothing to add under it
+                self._paint(start, end, "invalid")
+                self.setCurrentBlockState(NO_DEFINITION)
+                return
+            self._paint(start, start + depth, "punct")
+            body = self._alias(text, start + depth, end)
+            self._references(text, body, end)
+            self.setCurrentBlockState(depth + 1)
+            return
+
+        if (colon := text.find(":", start, end)) != -1:
+            name_end = len(text[:colon].rstrip())
+            named = name_end > start
+            if text.endswith(")", start, name_end) and (
+                paren := text.rfind("(", start, name_end)
+            ) != -1:
+                alias = text[paren + 1 : name_end - 1]
+                named = bool(text[start:paren].strip() or alias.strip())
+                self._paint(start, len(text[:paren].rstrip()), "vocab")
+                self._paint(paren, name_end, "alias")
+            else:
+                self._paint(start, name_end, "vocab")
+            self._paint(colon, colon + 1, "punct")
+            self._references(text, colon + 1, end)
+            self.setCurrentBlockState(1 if named else NO_DEFINITION)
+            if not named:
+                self._paint(start, end, "invalid")
+            return
+
+        lt = text.find("<", start, end)
+        valid = lt != -1 and bool(text[start:lt].strip())
+        gt = text.find(">", lt, end) if valid else -1
+        if valid and gt == -1:
+            valid = not _no_alias(text, lt + 1, end)  # parent < with nothing after
+        elif valid:
+            # a connection type and at least one node it goes to
+            targets = text[gt + 1 : end].split("&")
+            valid = bool(text[lt + 1 : gt].strip()) and any(map(str.strip, targets))
+        if not valid:
+            self._paint(start, end, "invalid")
+            self.setCurrentBlockState(NO_DEFINITION)
+            return
+        self._paint(start, len(text[:lt].rstrip()), "node")
+
+        if gt == -1:
+            # parent < (sub-alias) content
+            self._paint(lt, lt + 1, "punct")
+            body = self._alias(text, lt + 1, end)
+            self._references(text, body, end)
+            self.setCurrentBlockState(previous)
+            return
+
+        # node a <connection type> node b & node c
+        self._paint(lt, gt + 1, "connection")
+        position = gt + 1
+        while position < end:
+            amp = text.find("&", position, end)
+            stop = amp if amp != -1 else end
+            self._paint(position, stop, "node")
+            if amp == -1:
+                break
+            self._paint(amp, amp + 1, "punct")
+            position = amp + 1
+        self.setCurrentBlockState(previous)
+
+
+def benchmark(line_count=100_000, keystrokes=200):
+    """Seconds to highlight a generated notebook, and per keystroke after that"""
+    import os
+    import sys
+
+    from PySide6.QtWidgets import QApplication, QPlainTextEdit
+
+    sys.path.append(os.path.join(os.path.dirname(__file__), "..", "causality_lang"))
+    from benchmark import generate_document
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    text = generate_document(line_count // 2, comment_ratio=0.1)
+    lines = text.split("\n")[:line_count]
+    # an editor, a document without a layout doesn't tell the highlighter of edits
+    editor = QPlainTextEdit()
+    document = editor.document()
+    document.setPlainText("\n".join(lines))
+
+    start = time.perf_counter()
+    highlighter = NodelangHighlighter(document)
+    highlighter.rehighlight()
+    initial = time.perf_counter() - start
+    app.processEvents()
+
+    # type into the middle of the document
+    cursor = QTextCursor(document.findBlockByNumber(len(lines) // 2))
+    cursor.movePosition(QTextCursor.MoveOperation.EndOfBlock)
+    highlighter.calls = 0
+    start = time.perf_counter()
+    for _ in range(keystrokes):
+        cursor.insertText("x")
+    typing = (time.perf_counter() - start) / keystrokes
+    calls = highlighter.calls
+    highlighter.setDocument(None)
+    editor.deleteLater()
+    app.processEvents()
+    return {
+        "lines": len(lines),
+        "initial_seconds": initial,
+        "keystroke_seconds": typing,
+        "blocks_per_keystroke": calls / keystrokes,
+    }
+
+
+def health_check(count=5000, seed=0):
+    """Lines the highlighter marks invalid are the lines the lexer rejects"""
+    import os
+    import random
+    import sys
+
+    from PySide6.QtWidgets import QApplication, QPlainTextEdit
+
+    sys.path.append(os.path.join(os.path.dirname(__file__), "..", "causality_lang"))
+    from causality_lang import Token_kind, tokenize
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    rng = random.Random(seed)
+    pieces = ["a", "b c", " ", "<", "<<", ">", "(", ")", "()", ":", "&", "#", "|r|"]
+    # each line under a definition and a < and << line, so any depth can go there
+    above = ["d (d) : x", "< (c1) y", "<< (c2) z"]
+    lines = ["".join(rng.choices(pieces, k=rng.randint(1, 6))) for _ in range(count)]
+    editor = QPlainTextEdit()
+    editor.setPlainText("\n".join(part for line in lines for part in (*above, line)))
+    highlighter = NodelangHighlighter(editor.document())
+    highlighter.rehighlight()
+
+    invalid = highlighter.formats["invalid"].underlineStyle()
+    block = editor.document().begin()
+    for idx, line in enumerate(lines):
+        for _ in above:
+            block = block.next()
+        tokens = list(tokenize(line))
+        lexed = bool(tokens) and tokens[0].kind is Token_kind.INVALID
+        if tokens and tokens[0].kind is Token_kind.CONTINUE:
+            lexed = tokens[0].fields[0] > len(above)  # deeper than the parser takes
+        start = len(line) - len(line.lstrip())
+        painted = any(
+            fmt.start == start and fmt.format.underlineStyle() == invalid
+            for fmt in block.layout().formats()
+        )
+        assert painted == lexed, f"line {idx} {line!r} should be invalid={lexed}"
+        block = block.next()
+    highlighter.setDocument(None)
+    editor.deleteLater()
+    app.processEvents()
+
+
+if __name__ == "__main__":
+    health_check()
+    for count in (1_000, 10_000, 100_000):
+        result = benchmark(count)
+        print(
+            f"{result['lines']:>7} lines: highlighted in "
+            f"{result['initial_seconds'] * 1000:8.1f} ms, "
+            f"{result['keystroke_seconds'] * 1000:6.3f} ms "
+            f"({result['blocks_per_keystroke']:.1f} blocks) a keystroke"
+        )
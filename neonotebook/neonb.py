@@ -1,6 +1,15 @@
 # the main file
 
+import os
 import sys
+
+# causality_lang is imported from its folder next to this one, so the notebook runs
+# from a checkout. Elsewhere it needs pip install ./causality_lang
+sys.path.insert(
+    1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "causality_lang")
+)
+
+import PySide6
 from PySide6.QtWidgets import (
     QApplication, QWidget, QTextEdit, QMainWindow
 )
@@ -12,6 +21,9 @@ from notebook import NoteBook
 
 from event_bus import EventPublisher
 
+if sys.version_info < (3, 12) and PySide6.__version__.startswith("6.12."):
+    sys.exit("NeoNotebook can't run on PySide6 6.12 before Python 3.12, see README.md")
+
 app = QApplication(sys.argv)
 app.setWindowIcon(QIcon("icon.png"))
 app.setApplicationDisplayName("NeoNotebook")
@@ -1,12 +1,22 @@
 # notebook class -> notebook window
 
-from PySide6.QtWidgets import QApplication, QWidget, QTextEdit, QMainWindow, QFileDialog
+from PySide6.QtWidgets import (
+    QApplication,
+    QWidget,
+    QMainWindow,
+    QFileDialog,
+    QProgressBar,
+)
 from PySide6.QtCore import Qt, Signal, Slot
 from PySide6.QtGui import QAction, QKeySequence
 
 from menus.file_menu import FileMenu
 from menus.edit_menu import EditMenu
-from event_bus import EventPublisher
+from event_bus import EventPublisher, FILE
+from parse_worker import BackgroundParser
+from highlighter import NodelangHighlighter
+from file_worker import BackgroundFiles
+from completer import AliasCompleter, CompletingTextEdit
 
 # each notebook gets its own eventbus
 
@@ -20,7 +30,7 @@ class NoteBook(QMainWindow):
         self.events = event_api or EventPublisher()
 
         # the text editor part
-        self.text_area = QTextEdit()
+        self.text_area = CompletingTextEdit()
         self.main_window = self.text_area
         self.setCentralWidget(self.text_area)
 
@@ -34,6 +44,28 @@ class NoteBook(QMainWindow):
         self.fmenu = self.loadFileMenu()
         self.emenu = self.loadEditMenu()
 
+        # the text is parsed on another thread once typing pauses
+        self.parser = BackgroundParser(self.text_area, self.events)
+        self.highlighter = NodelangHighlighter(self.text_area.document())
+        self.completer = AliasCompleter(self.text_area, lambda: self.parser.graph)
+
+        # files are read and written on another thread, with the progress of
+        # opening one in the status bar
+        self.progress = QProgressBar()
+        self.progress.setMaximumWidth(160)
+        self.progress.hide()
+        self.statusBar().addPermanentWidget(self.progress)
+        self.files = BackgroundFiles(self.text_area, self.events, self.progress)
+        self.files.opened.connect(self.on_file)
+        self.files.saved.connect(self.on_file)
+        self.files.failed.connect(self.on_file_error)
+
+        document = self.text_area.document()
+        self.text_area.textChanged.connect(
+            lambda: self.events.emit_text_changed(document.revision())
+        )
+        self.events.subscribe(FILE, self.on_command)
+
     def loadFileMenu(self):
         self.file_menu = self.menu_bar.addMenu("&File")
 
@@ -94,25 +126,40 @@ class NoteBook(QMainWindow):
 
     def open_file(
         self,
-    ):  # file dialogue to get file path and reads the path and puts text
+    ):  # file dialogue to get file path, the file is read in the background
         print("open file")
         filepath, _ = QFileDialog.getOpenFileName(caption="Open File")
         print(filepath)
         if filepath:
-            with open(filepath, "rt") as f:
-                self.text_edit.setPlainText(f.read())
-                self.current_directory = filepath
+            self.files.open(filepath)
         else:
             print("no file found")
 
     def save_file(
         self,
-    ):  # add file dialogue later, currently just saves to current dir if there is one
+    ):  # saves to the current file, asks for one if there isn't one yet
         print("save file")
-        if self.current_directory:
-            content = self.text_edit.toPlainText()
-            with open(self.current_directory, "wt") as f:
-                f.write(content)
+        if self.current_file is None:
+            filepath, _ = QFileDialog.getSaveFileName(caption="Save File")
+            if not filepath:
+                return
+            self.files.save(filepath)
+        else:
+            self.files.save()
+
+    @Slot(str)
+    def on_file(self, path):
+        self.current_file = path
+        self.setWindowTitle(f"NeoNoteBook - {path}")
+
+    @Slot(str, str)
+    def on_file_error(self, path, error):
+        self.statusBar().showMessage(f"{path}: {error}", 5000)
+
+    def closeEvent(self, event):
+        self.parser.stop()
+        self.files.stop()
+        super().closeEvent(event)
 
     @Slot(dict)
     def on_command(self, msg):
@@ -0,0 +1,102 @@
+# parses the notebook into a causality_lang Graph off the ui thread
+
+import io
+import time
+from PySide6.QtCore import QObject, QThread, QTimer, Signal, Slot
+from PySide6.QtWidgets import QTextEdit
+
+from causality_lang import Graph
+
+from event_bus import EventPublisher
+
+CHECK_EVERY = 256  # lines parsed between checks for a newer job
+
+
+class _Cancelled(Exception): ...
+
+
+class ParseWorker(QObject):
+    # generation, graph, diagnostics, seconds
+    finished = Signal(int, object, list, float)
+
+    def __init__(self, latest):
+        super().__init__()
+        self.latest = latest  # () -> generation of the newest job
+
+    @Slot(int, str)
+    def parse(self, generation, text):
+        if generation != self.latest():
+            return  # a newer job is queued behind this one
+        start = time.perf_counter()
+        graph = Graph()
+        try:
+            diagnostics = graph.parse_stream(
+                self._lines(generation, text), recover=True
+            )
+        except _Cancelled:
+            return
+        # sorts the completion index here rather than on the first keystroke
+        graph.complete("")
+        self.finished.emit(generation, graph, diagnostics, time.perf_counter() - start)
+
+    def _lines(self, generation, text):
+        # stops the parse as soon as the text it is parsing is out of date
+        for number, line in enumerate(io.StringIO(text), 1):
+            if not number % CHECK_EVERY and generation != self.latest():
+                raise _Cancelled
+            yield line
+
+
+class BackgroundParser(QObject):
+    """
+    Parses the text of editor on a thread of its own once typing has paused for
+    delay ms, and publishes the graph and diagnostics through events.
+    The ui thread only restarts a timer per keystroke and copies the text once
+    per parse; a parse that a newer one overtakes is dropped or stopped.
+    """
+
+    parsed = Signal(object, list)  # graph, diagnostics
+    _requested = Signal(int, str)
+
+    def __init__(self, editor: QTextEdit, events: EventPublisher, delay: int = 300):
+        super().__init__()
+        self.editor = editor
+        self.events = events
+        self.graph: Graph | None = None
+        self.diagnostics: list = []
+        self._generation = 0
+
+        # debounce: every change restarts the countdown
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self.submit)
+        editor.textChanged.connect(self._timer.start)
+
+        self._thread = QThread(self)
+        self._worker = ParseWorker(lambda: self._generation)
+        self._worker.moveToThread(self._thread)
+        self._requested.connect(self._worker.parse)  # queued, runs on the thread
+        self._worker.finished.connect(self._done)
+        self._thread.start()
+
+    @Slot()
+    def submit(self):
+        # newer generations cancel whatever is still running or queued
+        self._generation += 1
+        self._requested.emit(self._generation, self.editor.toPlainText())
+
+    @Slot(int, object, list, float)
+    def _done(self, generation, graph, diagnostics, seconds):
+        if generation != self._generation:
+            return  # the text changed while this was parsed
+        self.graph = graph
+        self.diagnostics = diagnostics
+        self.events.emit_parse_result(graph, diagnostics, seconds)
+        self.parsed.emit(graph, diagnostics)
+
+    def stop(self):
+        self._timer.stop()
+        self._generation += 1
+        self._thread.quit()
+        self._thread.wait()